@@ -1,5 +1,5 @@
 from core.config import settings
-from core.model import create_model
+from core.model import create_model, Priority
 
 
 async def generate_title(question: str, answer: str):
@@ -7,8 +7,12 @@ async def generate_title(question: str, answer: str):
         settings.GENERIC_CHAT_TITLE_GENERATOR_MODEL,
         settings.OPENAI_API_KEY,
         settings.OPENAI_BASE_URL,
-        streaming=False
+        streaming=False,
+        priority=Priority.BACKGROUND
     )
+    # 标题只需要对话的开头部分
+    question = question[:settings.TITLE_MAX_INPUT_CHARS]
+    answer = answer[:settings.TITLE_MAX_INPUT_CHARS]
     prompt = """
         为以下对话生成一个简短的标题：\n
         Q：%s\n
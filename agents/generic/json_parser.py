@@ -1,21 +1,106 @@
-from pydantic import BaseModel
+import ast
+import json
+import re
+from typing import Any, Iterator
+
+from pydantic import BaseModel, ValidationError
 from langchain.messages import SystemMessage, HumanMessage
 
-from core.model import create_model
+from core.model import create_structured_model
 from core.config import settings
 
 
 agent_config = settings.get_agent_config("generic")["json_parser"]
 
+# 本地解析与模型解析的命中次数
+parse_json_stats = {"fast_path": 0, "llm_fallback": 0}
+
+_FENCED_BLOCK_RE = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.S)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _balanced_objects(text: str) -> Iterator[str]:
+    """依次找出文本中括号配对完整的 JSON 对象片段"""
+    start = text.find("{")
+    while start != -1:
+        depth, in_string, escaped = 0, False, False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    yield text[start:index + 1]
+                    break
+        start = text.find("{", start + 1)
+
+
+def _loads(text: str) -> Any:
+    text = text.strip()
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        pass
+    # 去掉多余的尾逗号
+    try:
+        return json.loads(_TRAILING_COMMA_RE.sub(r"\1", text), strict=False)
+    except ValueError:
+        pass
+    # 兼容单引号等 Python 字面量写法
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def _candidates(content: str) -> Iterator[Any]:
+    blocks = _FENCED_BLOCK_RE.findall(content) or [content]
+    for block in blocks:
+        data = _loads(block)
+        if data is not None:
+            yield data
+        for fragment in _balanced_objects(block):
+            data = _loads(fragment)
+            if data is not None:
+                yield data
+
+
+def extract_json(content: str, schema: type[BaseModel] | dict) -> Any:
+    """不调用模型，直接从文本中提取并校验 JSON 数据，失败时返回 None"""
+    for data in _candidates(content):
+        if not isinstance(data, dict):
+            continue
+        if not isinstance(schema, type):
+            return data
+        try:
+            return schema.model_validate(data)
+        except ValidationError:
+            continue
+    return None
+
 
 async def parse_json(
-    content: str, 
-    schema: BaseModel | dict, 
+    content: str,
+    schema: BaseModel | dict,
     streaming: bool = False,
     method: str = "json_schema"
 ):
-    model = create_model(agent_config.model, streaming=streaming)
-    structured_model = model.with_structured_output(schema, method=method)
+    result = extract_json(content, schema)
+    if result is not None:
+        parse_json_stats["fast_path"] += 1
+        return result
+    parse_json_stats["llm_fallback"] += 1
+    structured_model = create_structured_model(agent_config.model, schema, streaming=streaming, method=method)
     messages = [
         SystemMessage(agent_config.original_prompt),
         HumanMessage("从下面的文本中提取出指定schema的JSON数据：\n" + content)
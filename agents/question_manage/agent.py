@@ -1,4 +1,7 @@
+from functools import cache
+
 from langgraph.graph import StateGraph
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.checkpoint.mysql.aio_base import BaseAsyncMySQLSaver
 from langgraph.store.mysql.aio_base import BaseAsyncMySQLStore
 
@@ -37,3 +40,15 @@ def build_question_manage_graph(checkpointer: BaseAsyncMySQLSaver = None, store:
     graph_builder.add_edge("planner", "dispatcher")
 
     return graph_builder.compile(checkpointer, store=store, **kwargs)
+
+
+@cache
+def _compiled_question_manage_graph() -> CompiledStateGraph:
+    return build_question_manage_graph()
+
+
+def get_question_manage_graph(checkpointer: BaseAsyncMySQLSaver = None, store: BaseAsyncMySQLStore = None) -> CompiledStateGraph:
+    """返回进程内只编译一次的图，并为本次调用绑定检查点与存储"""
+    return _compiled_question_manage_graph().copy(
+        {"checkpointer": checkpointer, "store": store, "auto_validate": False}
+    )
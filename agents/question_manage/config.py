@@ -2,8 +2,17 @@ from langchain.agents.middleware import ToolRetryMiddleware, AgentMiddleware
 
 from core.config import settings
 from core.middlewares import ToolCallMonitorMiddleware
+from .question_cache import QuestionDataCacheMiddleware
+from .state import QuestionMetadata
 
 # 智能体的配置信息
 agent_config = settings.get_agent_config("question_manage")
+# 这些助手的系统提示词由题目元信息填充，启动时预编译并校验模板变量
+for _name in ("judge_template_for_python", "memory_time_limit", "solving_framework", "test"):
+    agent_config[_name].register_prompt_variables(QuestionMetadata.model_fields)
 # 工具节点需要使用的中间件列表
-tool_call_node_middlewares: list[AgentMiddleware] = [ToolCallMonitorMiddleware(), ToolRetryMiddleware()]
+tool_call_node_middlewares: list[AgentMiddleware] = [
+    ToolCallMonitorMiddleware(),
+    QuestionDataCacheMiddleware(),
+    ToolRetryMiddleware()
+]
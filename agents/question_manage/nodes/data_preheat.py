@@ -1,37 +1,52 @@
+from langchain.messages import AIMessage
 from langchain_core.runnables import RunnableConfig
-from langchain.agents import create_agent
-from langgraph.config import get_stream_writer
+from langgraph.config import get_stream_writer, get_store
 
 from agents.generic.json_parser import parse_json
-from utils.tool import load_tools_from_config
-from core.model import create_model
 from .node_log import create_node_call_log
 from ..state import QuestionMetadata, QuestionManageMessagesState
-from ..config import agent_config, tool_call_node_middlewares
+from ..config import agent_config
+from ..sub_agent import get_sub_agent
+from ..question_cache import question_data_cache, extract_question_id, mentions_new_question
+from .dispatcher import pending_step_ids, mentioned_assistants
 
 
 async def data_preheat_node(state: QuestionManageMessagesState, config: RunnableConfig) -> QuestionManageMessagesState:
     writer = get_stream_writer()
     writer(create_node_call_log("data_preheat", "数据预助手开始处理任务", "entry"))
-    # 获取配置并创建模型
+    store = get_store()
+    last_message = state["messages"][-1]
+    # 新一轮对话开始时，放弃上一轮中断后遗留的计划步骤
+    skipped_steps = pending_step_ids(state)
+    # 明确要求处理某道已有题目的数据（后续一定会用到题目信息）且该题目已有缓存时，跳过工具调用；
+    # 其余输入（包括参考已有题目新建题目）仍由数据预热助手处理，查询结果由工具结果缓存加速
+    text = last_message.text
+    question_id = extract_question_id(text)
+    if question_id is not None and mentioned_assistants(text) and not mentions_new_question(text):
+        question_metadata = await question_data_cache.get_metadata(store, question_id)
+        if question_metadata is not None:
+            writer(create_node_call_log("data_preheat", "已从缓存中获取题目信息", "finish"))
+            content = f"```json\n{question_metadata.model_dump_json(indent=4)}\n```"
+            return {
+                "question_metadata": question_metadata,
+                "display_messages": [last_message, AIMessage(content)],
+                "skipped_steps": skipped_steps
+            }
     data_preheat_config = agent_config["data_preheat"]
-    model = create_model(data_preheat_config.model)
-    # 加载工具列表
-    tools = await load_tools_from_config(config, data_preheat_config.tools)
-    # 创建 Agent
-    agent = create_agent(
-        model, 
-        tools, 
-        system_prompt=data_preheat_config.original_prompt,
-        middleware=tool_call_node_middlewares
+    # 获取已编译的子智能体
+    agent = await get_sub_agent("data_preheat", config)
+    output_state = await agent.ainvoke(
+        {"messages": [last_message]},
+        config,
+        context={"system_prompt": data_preheat_config.original_prompt}
     )
-    output_state = await agent.ainvoke({"messages": [state["messages"][-1]]}, config)
     writer(create_node_call_log("data_preheat", "数据预助手处理任务完成", "finish"))
     output_messages = output_state["messages"]
     last_content = output_messages[-1].content
     # 不需要执行任务，仅聊天状态
     if last_content[0] != "`":
-        return {"display_messages": output_messages}
+        return {"display_messages": output_messages, "skipped_steps": skipped_steps}
     # 将结果解析为标准JSON字符串
     question_metadata = await parse_json(last_content, QuestionMetadata)
-    return {"question_metadata": question_metadata, "display_messages": output_messages}
+    await question_data_cache.put_metadata(store, question_metadata)
+    return {"question_metadata": question_metadata, "display_messages": output_messages, "skipped_steps": skipped_steps}
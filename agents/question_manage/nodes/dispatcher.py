@@ -1,6 +1,7 @@
-from langchain.messages import SystemMessage
+from langchain.messages import SystemMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.constants import END
+from langgraph.types import Send
 from langgraph.config import get_stream_writer
 
 from .node_log import create_node_call_log
@@ -20,26 +21,116 @@ path_map = [
 ]
 
 
+# 各个助手对应的关键词，用于不经过模型直接分配只涉及一个助手的任务
+ASSISTANT_KEYWORDS = {
+    "judge_template_for_python": ("判题模板", "判断模板"),
+    "memory_time_limit": ("内存", "时间限制", "时空限制"),
+    "solving_framework": ("解题框架",),
+    "test": ("测试用例", "测试数据")
+}
+# 明确要求执行写入操作的动词，没有这些动词时只是提到了相关内容，例如“为什么第3题内存超限了”
+ACTION_VERBS = ("创建", "新建", "新增", "添加", "生成", "编写", "修改", "更新", "调整", "设置", "补充", "完善")
+# 疑问的语气，这类输入交给调度模型判断
+QUESTION_MARKERS = ("为什么", "怎么", "如何", "是否", "吗", "?", "？")
+
+
+def mentioned_assistants(text: str) -> list[str]:
+    """返回用户输入中通过关键词提到的助手"""
+    return [name for name, keywords in ASSISTANT_KEYWORDS.items() if any(k in text for k in keywords)]
+
+
+def route_by_rules(state: QuestionManageMessagesState) -> Step | None:
+    """根据关键词分配本轮对话的第一个任务。
+
+    只有明确要求执行操作（有动作动词且不是疑问）并且只涉及一个助手时才直接交给该助手，
+    其余情况返回 None，由调度模型决定。
+    """
+    text = state["messages"][-1].text
+    if not any(verb in text for verb in ACTION_VERBS) or any(marker in text for marker in QUESTION_MARKERS):
+        return None
+    assistants = mentioned_assistants(text)
+    if len(assistants) != 1:
+        return None
+    # 作为只有一个步骤的计划执行，完成后无需再询问调度模型
+    return Step(assistant=assistants[0], task_description=text, id=len(state["plan"]) + 1)
+
+
+def current_plan(state: QuestionManageMessagesState) -> list[Step]:
+    """返回最近一次规划出的步骤，调度器临时指派步骤之后视为没有计划"""
+    steps = []
+    for step in reversed(state.get("plan") or []):
+        if step.id is None:
+            break
+        steps.append(step)
+    return steps
+
+
+def _settled_step_ids(state: QuestionManageMessagesState) -> set[int]:
+    # 已完成、失败或被放弃的步骤都不会再执行
+    return (
+        set(state.get("finished_steps") or [])
+        | set(state.get("failed_steps") or [])
+        | set(state.get("skipped_steps") or [])
+    )
+
+
+def pending_step_ids(state: QuestionManageMessagesState) -> list[int]:
+    """返回计划中尚未完成（也没有失败或被放弃）的步骤编号"""
+    settled = _settled_step_ids(state)
+    return [step.id for step in state.get("plan") or [] if step.id is not None and step.id not in settled]
+
+
+def ready_steps(state: QuestionManageMessagesState) -> list[Step]:
+    """返回计划中尚未执行且依赖均已完成的步骤，依赖失败的步骤需要调度助手重新规划"""
+    planned = {step.id: step for step in state.get("plan") or [] if step.id is not None}
+    finished = set(state.get("finished_steps") or [])
+    settled = _settled_step_ids(state)
+    return [
+        step for step_id, step in planned.items()
+        if step_id not in settled and all(dep in finished or dep not in planned for dep in step.depends_on)
+    ]
+
+
 async def dispatcher_node(state: QuestionManageMessagesState, config: RunnableConfig) -> QuestionManageMessagesState:
     # 仅聊天模式，不需要执行任务
     question_metadata = state.get("question_metadata")
     if question_metadata is None:
         return {"plan": [Step(assistant=None, task_description="")]}
+    # 计划中还有可以执行的步骤，直接交给 dispatch_next_node 分发
+    if ready_steps(state):
+        return {}
+    # 本轮对话的第一次调度，需求明确时不需要询问模型
+    first_dispatch = isinstance(state["messages"][-1], HumanMessage)
+    if first_dispatch:
+        step = route_by_rules(state)
+        if step is not None:
+            return {"plan": [step]}
+    # 本轮计划中的步骤全部成功完成，直接结束；上一轮的计划不代表本轮的需求
+    plan = current_plan(state)
+    failed = set(state.get("failed_steps") or [])
+    if not first_dispatch and plan and not pending_step_ids(state) and not any(step.id in failed for step in plan):
+        return {"plan": [Step(assistant=None, task_description="")]}
+    # 没有计划、计划执行失败或需要重新规划时，由调度模型决定下一步
     writer = get_stream_writer()
     writer(create_node_call_log("dispatcher", "任务调度助手开始分配任务", "entry"))
     dispatcher_config = agent_config["dispatcher"]
-    model = create_model(dispatcher_config.model)
+    model = create_model(dispatcher_config.model, policy=dispatcher_config.policy)
     messages = [SystemMessage(dispatcher_config.original_prompt)] + state["messages"]
     response = await model.ainvoke(messages, config)
     writer(create_node_call_log("dispatcher", "任务调度助手分配任务完毕", "finish"))
     step = await parse_json(response.content, Step)
-    return {"plan": [step]}
+    # 调度器指派的步骤不属于计划，忽略模型可能给出的编号
+    return {"plan": [step.model_copy(update={"id": None, "depends_on": []})]}
 
 
 def dispatch_next_node(state: QuestionManageMessagesState):
     plan = state.get("plan")
     if plan is None:
         return END
+    # 互不依赖的步骤并行执行，每个分支只看到自己的步骤
+    steps = ready_steps(state)
+    if steps:
+        return [Send(step.assistant, {**state, "plan": [step]}) for step in steps]
     assistant = plan[-1].assistant
     if assistant is None:
         return END
@@ -5,26 +5,49 @@ from langchain.messages import HumanMessage, AIMessage
 from langgraph.config import get_stream_writer
 
 from .node_log import create_node_call_log
+from .step import step_node
 from ..config import agent_config
 from ..state import QuestionManageMessagesState, Step
-from core.model import create_model
+from core.model import create_structured_model
 
 
 class StructuredOutput(BaseModel):
     plan: list[Step]
 
 
+def renumber_steps(steps: list[Step], offset: int) -> list[Step]:
+    """将规划器输出的步骤编号映射为当前对话中唯一的编号。
+
+    规划器没有给出编号时按顺序串行执行，与旧的规划方式保持一致。
+    """
+    if all(step.id is None for step in steps):
+        return [
+            step.model_copy(update={"id": offset + i, "depends_on": [offset + i - 1] if i > 1 else []})
+            for i, step in enumerate(steps, start=1)
+        ]
+    id_map = {step.id: offset + i for i, step in enumerate(steps, start=1) if step.id is not None}
+    return [
+        step.model_copy(update={
+            "id": offset + i,
+            "depends_on": [id_map[dep] for dep in step.depends_on if dep in id_map and id_map[dep] != offset + i]
+        })
+        for i, step in enumerate(steps, start=1)
+    ]
+
+
+@step_node("planner", "任务规划助手")
 async def planner_node(state: QuestionManageMessagesState, config: RunnableConfig) -> QuestionManageMessagesState:
     writer = get_stream_writer()
     writer(create_node_call_log("planner", "任务规划助手开始执行任务", "entry"))
     planner_config = agent_config["planner"]
-    model = create_model(planner_config.model).with_structured_output(StructuredOutput)
+    model = create_structured_model(planner_config.model, StructuredOutput, policy=planner_config.policy)
     messages = [planner_config.original_prompt] + [HumanMessage(state["plan"][-1].task_description)]
     response = await model.ainvoke(messages, config)
+    steps = renumber_steps([step for step in response.plan if step.assistant not in (None, "planner")], len(state["plan"]))
     plan_description = []
-    for i, step in enumerate(response.plan, start=1):
-        step_description = f"{i}.assistant: {step.assistant}, task_description: {step.task_description}\n"
+    for step in steps:
+        step_description = f"{step.id}.assistant: {step.assistant}, task_description: {step.task_description}, depends_on: {step.depends_on}\n"
         plan_description.append(step_description)
-    plan = "我是<planner>助手，我已经帮你规划好了各个助手的调用顺序了，请按照以下顺序来调用助手：\n" + "".join(plan_description)
+    plan = "我是<planner>助手，我已经帮你规划好了各个助手的调用顺序了，没有依赖关系的任务会同时执行：\n" + "".join(plan_description)
     writer(create_node_call_log("planner", "任务规划助手执行任务完成", "finish"))
-    return {"messages": [AIMessage(plan)]}
+    return {"messages": [AIMessage(plan)], "plan": steps}
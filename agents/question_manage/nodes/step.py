@@ -0,0 +1,39 @@
+from functools import wraps
+from typing import Awaitable, Callable
+
+from langchain.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
+from langgraph.errors import GraphBubbleUp
+from uvicorn.config import logger
+
+from .node_log import create_node_call_log
+from ..state import QuestionManageMessagesState
+
+
+StepNode = Callable[[QuestionManageMessagesState, RunnableConfig], Awaitable[QuestionManageMessagesState]]
+
+
+def step_node(name: str, assistant_name: str) -> Callable[[StepNode], StepNode]:
+    """包装执行计划步骤的节点，记录步骤是否完成。
+
+    节点执行失败时不会中断整个流程，失败信息会写入消息中，由调度助手决定是否重新规划。
+    """
+    def decorator(node: StepNode) -> StepNode:
+        @wraps(node)
+        async def wrapper(state: QuestionManageMessagesState, config: RunnableConfig) -> QuestionManageMessagesState:
+            step = state["plan"][-1]
+            step_ids = [step.id] if step.id is not None else []
+            try:
+                output = await node(state, config)
+            except GraphBubbleUp:
+                raise
+            except Exception as e:
+                logger.exception(f"Step {name} failed")
+                writer = get_stream_writer()
+                writer(create_node_call_log(name, f"{assistant_name}执行任务失败", "finish"))
+                message = f"我是<{name}>助手，我没能完成这个任务，错误信息：{e}"
+                return {"messages": [AIMessage(message)], "failed_steps": step_ids}
+            return {**output, "finished_steps": step_ids}
+        return wrapper
+    return decorator
@@ -0,0 +1,152 @@
+import re
+import time
+from typing import Any, Optional
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain.messages import ToolMessage
+from langchain.tools.tool_node import ToolCallRequest
+from langgraph.store.base import BaseStore
+from uvicorn.config import logger
+
+from core.config import settings
+from utils.cache import TTLCache
+from .state import QuestionMetadata
+
+
+QUESTION_METADATA_NAMESPACE = ("question_manage", "question_metadata")
+TOOL_RESULT_NAMESPACE = ("question_manage", "tool_results")
+
+# 结果可以被缓存的只读工具
+CACHEABLE_TOOLS = {"query_question_info", "query_all_tags", "query_all_programming_languages"}
+# 写入类工具的名称前缀
+WRITE_TOOL_PREFIXES = ("create_", "update_", "delete_")
+# 修改题目数据的写入类工具（如 update_solving_framework_for_question、create_test_for_question），
+# 执行成功后使参数中题目的缓存失效
+QUESTION_WRITE_TOOLS = frozenset(
+    tool
+    for agents in settings.AGENTS_CONFIG_TEMPLATE.values()
+    for agent in agents.values()
+    for tool in agent.get("tools", ())
+    if tool.startswith(WRITE_TOOL_PREFIXES)
+)
+
+# 新建题目的意图，如“参考题目12创建一道新题目”“仿照题目 7 新建一道题目”
+_NEW_QUESTION_RE = re.compile(
+    r"(?:创建|新建|新增|编写|出)\s*(?:一|1)?\s*(?:道|个)?\s*(?:新的?)?\s*(?:题目|题)|新题|仿照|参考|类似|"
+    r"create\s+(?:a\s+)?(?:new\s+)?question",
+    re.IGNORECASE
+)
+_QUESTION_ID_RE = re.compile(r"(?:题目|question)\s*(?:id|ID|编号)?\s*(?:为|是|[:：=#])?\s*(\d+)|(?:id|ID|编号)\s*(?:为|是|[:：=#])?\s*(\d+)")
+
+
+class QuestionDataCache:
+    """跨会话的题目数据缓存。
+
+    数据持久化在 LangGraph 的 store 中，进程内再用一层短有效期的 LRU 缓存挡住重复的数据库查询，
+    store 中的条目记录写入时间，超过有效期后视为未命中。
+    失效只删除本进程与 store 中的条目，其它进程的进程内缓存最多在 local_ttl 秒后过期。
+    """
+
+    def __init__(self, ttl: float = 3600.0, maxsize: int = 1024, local_ttl: float = 10.0):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self.store_hits = 0
+
+    async def get(self, store: Optional[BaseStore], namespace: tuple[str, ...], key: str) -> Any:
+        value = self._local.get((namespace, key))
+        if value is not None or store is None:
+            return value
+        try:
+            item = await store.aget(namespace, key)
+        except Exception as e:
+            logger.warning(f"Failed to read question cache {namespace}/{key}: {e}")
+            return None
+        if item is None:
+            return None
+        remaining = self.ttl - (time.time() - item.value["cached_at"])
+        if remaining <= 0:
+            return None
+        self.store_hits += 1
+        self._local.set((namespace, key), item.value["value"], ttl=min(remaining, self.local_ttl))
+        return item.value["value"]
+
+    async def put(self, store: Optional[BaseStore], namespace: tuple[str, ...], key: str, value: Any):
+        self._local.set((namespace, key), value)
+        if store is None:
+            return
+        try:
+            await store.aput(namespace, key, {"value": value, "cached_at": time.time()}, index=False)
+        except Exception as e:
+            logger.warning(f"Failed to write question cache {namespace}/{key}: {e}")
+
+    async def delete(self, store: Optional[BaseStore], namespace: tuple[str, ...], key: str):
+        self._local.pop((namespace, key))
+        if store is None:
+            return
+        try:
+            await store.adelete(namespace, key)
+        except Exception as e:
+            logger.warning(f"Failed to delete question cache {namespace}/{key}: {e}")
+
+    async def get_metadata(self, store: Optional[BaseStore], question_id: int) -> Optional[QuestionMetadata]:
+        value = await self.get(store, QUESTION_METADATA_NAMESPACE, str(question_id))
+        return QuestionMetadata.model_validate(value) if value is not None else None
+
+    async def put_metadata(self, store: Optional[BaseStore], metadata: QuestionMetadata):
+        await self.put(store, QUESTION_METADATA_NAMESPACE, str(metadata.question_id), metadata.model_dump())
+
+    async def invalidate_question(self, store: Optional[BaseStore], question_id: int):
+        await self.delete(store, QUESTION_METADATA_NAMESPACE, str(question_id))
+        await self.delete(store, TOOL_RESULT_NAMESPACE, f"query_question_info:{question_id}")
+
+    def stats(self) -> dict[str, int]:
+        return {**self._local.stats(), "store_hits": self.store_hits}
+
+
+question_data_cache = QuestionDataCache(
+    ttl=settings.QUESTION_CACHE_TTL,
+    maxsize=settings.QUESTION_CACHE_MAXSIZE,
+    local_ttl=settings.QUESTION_CACHE_LOCAL_TTL
+)
+
+
+def extract_question_id(text: str) -> Optional[int]:
+    """从用户输入中提取唯一的题目ID，提到多个或没有提到时返回 None"""
+    ids = {int(a or b) for a, b in _QUESTION_ID_RE.findall(text)}
+    return ids.pop() if len(ids) == 1 else None
+
+
+def mentions_new_question(text: str) -> bool:
+    """用户输入中是否有新建题目的意图，此时提到的题目ID只是参考，不是要处理的题目"""
+    return _NEW_QUESTION_RE.search(text) is not None
+
+
+def _tool_result_key(name: str, args: dict) -> Optional[str]:
+    if name == "query_question_info":
+        question_id = args.get("question_id")
+        return f"{name}:{question_id}" if question_id is not None else None
+    # 标签与编程语言列表与参数无关
+    return name
+
+
+class QuestionDataCacheMiddleware(AgentMiddleware):
+    """缓存只读工具的调用结果，写入类工具执行成功后使相关缓存失效"""
+
+    async def awrap_tool_call(self, request: ToolCallRequest, handler):
+        name = request.tool_call["name"]
+        args = request.tool_call["args"]
+        store = request.runtime.store if request.runtime is not None else None
+        key = _tool_result_key(name, args) if name in CACHEABLE_TOOLS else None
+        if key is not None:
+            content = await question_data_cache.get(store, TOOL_RESULT_NAMESPACE, key)
+            if content is not None:
+                return ToolMessage(content=content, name=name, tool_call_id=request.tool_call["id"])
+        result = await handler(request)
+        if not isinstance(result, ToolMessage) or result.status == "error":
+            return result
+        if key is not None:
+            await question_data_cache.put(store, TOOL_RESULT_NAMESPACE, key, result.content)
+        elif name in QUESTION_WRITE_TOOLS and args.get("question_id") is not None:
+            await question_data_cache.invalidate_question(store, args["question_id"])
+        return result
@@ -17,6 +17,10 @@ class QuestionMetadata(BaseModel):
 class Step(BaseModel):
     assistant: Literal["judge_template_for_python", "memory_time_limit", "solving_framework", "test", "planner", None]
     task_description: str
+    # 由规划器生成的步骤编号，调度器临时指派的步骤没有编号
+    id: Optional[int] = None
+    # 需要先完成的步骤编号
+    depends_on: list[int] = []
 
 
 class QuestionManageMessagesState(MessagesState):
@@ -24,5 +28,11 @@ class QuestionManageMessagesState(MessagesState):
     question_metadata: Optional[QuestionMetadata]
     # 任务执行计划
     plan: Annotated[list[Step], add]
+    # 已完成的计划步骤编号
+    finished_steps: Annotated[list[int], add]
+    # 执行失败的计划步骤编号
+    failed_steps: Annotated[list[int], add]
+    # 上一轮中断后遗留、新一轮对话开始时被放弃的计划步骤编号
+    skipped_steps: Annotated[list[int], add]
     # 展示给客户端的对话信息
     display_messages: Annotated[list[AnyMessage], add_messages]
@@ -0,0 +1,55 @@
+from typing import TypedDict
+
+from langchain.agents import create_agent
+from langchain.agents.middleware import dynamic_prompt, ModelRequest
+from langchain.messages import SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+
+from core.model import create_model
+from utils.tool import load_shared_tools, mcp_tool_catalog
+from .config import agent_config, tool_call_node_middlewares
+
+
+class SubAgentContext(TypedDict):
+    # 每次调用时传入的系统提示词
+    system_prompt: str | SystemMessage
+
+
+@dynamic_prompt
+def context_system_prompt(request: ModelRequest) -> str | SystemMessage:
+    return request.runtime.context["system_prompt"]
+
+
+# 节点名 -> (工具目录版本, 编译好的子智能体)
+_sub_agents: dict[str, tuple[int, CompiledStateGraph]] = {}
+
+
+async def get_sub_agent(name: str, config: RunnableConfig | None = None) -> CompiledStateGraph:
+    """获取节点对应的子智能体，同一版本的工具目录下只编译一次。
+
+    子智能体的工具在调用时才绑定当前的后端会话，系统提示词通过 context 传入，
+    因此同一个子智能体可以被所有请求复用。
+    """
+    node_config = agent_config[name]
+    tools = await load_shared_tools(config, node_config.tools)
+    cached = _sub_agents.get(name)
+    if cached is not None and cached[0] == mcp_tool_catalog.version:
+        return cached[1]
+    agent = create_agent(
+        create_model(node_config.model, policy=node_config.policy),
+        tools,
+        middleware=[context_system_prompt, *tool_call_node_middlewares],
+        context_schema=SubAgentContext
+    )
+    _sub_agents[name] = (mcp_tool_catalog.version, agent)
+    return agent
+
+
+async def warm_up_sub_agents():
+    """在工具目录可用时预先编译所有带工具的子智能体"""
+    if mcp_tool_catalog.stale:
+        return
+    for name, node_config in agent_config.items():
+        if node_config.tools:
+            await get_sub_agent(name)
@@ -1,12 +1,16 @@
+from functools import cache
+
 from langchain.messages import HumanMessage
 from langgraph.checkpoint.mysql.aio_base import BaseAsyncMySQLSaver
 from langgraph.store.mysql.aio_base import BaseAsyncMySQLStore
 from langgraph.graph import StateGraph, MessagesState
-from langchain_core.prompts import SystemMessagePromptTemplate
+from langgraph.graph.state import CompiledStateGraph
 from langchain_core.runnables import RunnableConfig
+from uvicorn.config import logger
 
-from core.model import create_model
+from core.model import create_model, Priority
 from core.config import settings
+from .context import build_history, record_context_usage, messages_to_summarize, update_summary
 
 
 agent_config = settings.get_agent_config("solving_assistant")
@@ -19,12 +23,18 @@ class SolvingAssistantMessagesState(MessagesState):
     user_profile: str
     user_memory: str
     username: str
+    # 较早对话的摘要，以及已被折叠进摘要的消息数量
+    summary: str
+    summarized_count: int
+
+
+# 启动时预编译系统提示词模板，并校验模板变量都是 node 传入的参数
+solving_assistant.register_prompt_variables(["question_description", "user_profile", "user_memory", "username"])
 
 
 async def node(state: SolvingAssistantMessagesState, config: RunnableConfig):
     # 构造系统提示词
-    prompt_template = SystemMessagePromptTemplate.from_template(solving_assistant.original_prompt)
-    system_prompt = prompt_template.format(
+    system_prompt = solving_assistant.format_prompt(
         question_description=state["question_description"],
         user_profile=state["user_profile"],
         user_memory=state["user_memory"],
@@ -35,13 +45,36 @@ async def node(state: SolvingAssistantMessagesState, config: RunnableConfig):
     last_message = messages[-1]
     code = state["code"]
     processed_input = f"<用户当前解题代码>:\n{code}\n<用户输入>:\n{last_message.content}"
-    # 构造输入
-    input_messages = [system_prompt] + messages[:-1] + [HumanMessage(processed_input)]
-    model = create_model(solving_assistant.model)
+    # 构造输入，较早的对话以摘要代替
+    history = build_history(messages[:-1], state.get("summary", ""), state.get("summarized_count", 0))
+    input_messages = [system_prompt] + history + [HumanMessage(processed_input)]
+    tokens_before, tokens_after = record_context_usage([system_prompt] + messages, input_messages)
+    logger.info(f"Solving assistant context: {tokens_after} tokens, saved {tokens_before - tokens_after} tokens")
+    # 用户正在等待回答，优先调度
+    model = create_model(solving_assistant.model, priority=Priority.INTERACTIVE, policy=solving_assistant.policy)
     output = await model.ainvoke(input_messages, config)
     return {"messages": [last_message, output]}
 
 
+async def summarize(state: SolvingAssistantMessagesState):
+    """将超出保留范围的较早对话折叠进摘要，返回需要写入状态的更新。
+
+    在回答推送完毕后由后台任务调用，不占用流式响应的时间。
+    """
+    summarized_count = state.get("summarized_count", 0)
+    count = messages_to_summarize(state["messages"], summarized_count)
+    if count == 0:
+        return {}
+    messages = state["messages"][summarized_count:summarized_count + count]
+    try:
+        summary = await update_summary(state.get("summary", ""), messages)
+    except Exception as e:
+        # 摘要失败不影响本轮回答，下一轮会再次尝试
+        logger.warning(f"Failed to summarize solving assistant conversation: {e}")
+        return {}
+    return {"summary": summary, "summarized_count": summarized_count + count}
+
+
 def create_solving_assistant(checkpointer: BaseAsyncMySQLSaver = None, store: BaseAsyncMySQLStore = None, **kwargs):
     graph_builder = StateGraph(SolvingAssistantMessagesState)
 
@@ -49,3 +82,15 @@ def create_solving_assistant(checkpointer: BaseAsyncMySQLSaver = None, store: Ba
     graph_builder.set_entry_point("node")
 
     return graph_builder.compile(checkpointer, store=store, **kwargs)
+
+
+@cache
+def _compiled_solving_assistant() -> CompiledStateGraph:
+    return create_solving_assistant()
+
+
+def get_solving_assistant(checkpointer: BaseAsyncMySQLSaver = None, store: BaseAsyncMySQLStore = None) -> CompiledStateGraph:
+    """返回进程内只编译一次的图，并为本次调用绑定检查点与存储"""
+    return _compiled_solving_assistant().copy(
+        {"checkpointer": checkpointer, "store": store, "auto_validate": False}
+    )
@@ -0,0 +1,81 @@
+import hashlib
+import re
+from typing import Optional
+
+from uvicorn.config import logger
+
+from core.config import settings
+from core.database import get_cached_answer, save_cached_answer
+from utils.cache import TTLCache
+
+
+_PUNCTUATION_RE = re.compile(r"[\s\W_]+", re.U)
+
+
+def normalize_query(query: str) -> str:
+    """忽略大小写、空白与标点符号的差异"""
+    return _PUNCTUATION_RE.sub("", query.lower())
+
+
+def hash_code(code: str) -> str:
+    """忽略行尾空白与空行的差异"""
+    lines = [line.rstrip() for line in code.strip().splitlines() if line.strip()]
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+def answer_cache_key(question_id: int, query: str, code: str, personalization: str = "") -> str:
+    raw = f"{question_id}\x00{normalize_query(query)}\x00{hash_code(code)}\x00{personalization}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class AnswerCache:
+    """智能刷题助手的回答缓存。
+
+    以题目ID、归一化后的提问、代码哈希与个性化指纹（用户画像的概要与选中的记忆）为键，
+    进程内 LRU 在前，MySQL 中的 answer_cache 表在后。画像概要相同的用户共享缓存的回答，
+    带有个性化记忆的提问几乎不会与其他用户相同，命中率接近于零。
+    """
+
+    def __init__(self, ttl: int = 86400, maxsize: int = 2048, max_per_question: int = 50):
+        self.ttl = ttl
+        self.max_per_question = max_per_question
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.database_hits = 0
+        self.skipped = 0
+
+    async def get(self, question_id: int, query: str, code: str, personalization: str) -> Optional[str]:
+        key = answer_cache_key(question_id, query, code, personalization)
+        answer = self._local.get(key)
+        if answer is None:
+            try:
+                answer = await get_cached_answer(key, self.ttl)
+            except Exception as e:
+                logger.warning(f"Failed to read answer cache: {e}")
+                return None
+            if answer is None:
+                return None
+            self.database_hits += 1
+            self._local.set(key, answer)
+        return answer
+
+    async def put(self, question_id: int, query: str, code: str, personalization: str, answer: str, username: str):
+        """提到了用户名的回答是针对该用户的，不缓存"""
+        if not answer or (username and username in answer):
+            self.skipped += 1
+            return
+        key = answer_cache_key(question_id, query, code, personalization)
+        self._local.set(key, answer)
+        try:
+            await save_cached_answer(question_id, key, answer, self.max_per_question)
+        except Exception as e:
+            logger.warning(f"Failed to write answer cache: {e}")
+
+    def stats(self) -> dict[str, int]:
+        return {**self._local.stats(), "database_hits": self.database_hits, "skipped": self.skipped}
+
+
+answer_cache = AnswerCache(
+    ttl=settings.ANSWER_CACHE_TTL,
+    maxsize=settings.ANSWER_CACHE_MAXSIZE,
+    max_per_question=settings.ANSWER_CACHE_MAX_PER_QUESTION
+)
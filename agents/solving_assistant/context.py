@@ -0,0 +1,82 @@
+from langchain.messages import AnyMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately, get_buffer_string
+from langgraph.constants import TAG_NOSTREAM
+
+from core.model import create_model, Priority
+from core.config import settings
+
+
+agent_config = settings.get_agent_config("solving_assistant")
+conversation_summary = agent_config["conversation_summary"]
+
+# 上下文压缩的累计效果
+context_stats = {"turns": 0, "tokens_before": 0, "tokens_after": 0, "summaries": 0}
+
+
+def split_turns(messages: list[AnyMessage]) -> list[list[AnyMessage]]:
+    """按用户消息将对话切分为若干轮"""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def build_history(messages: list[AnyMessage], summary: str, summarized_count: int) -> list[AnyMessage]:
+    """构造发送给模型的历史对话：较早的对话以摘要代替，最近的对话原样保留。
+
+    未被摘要的对话仍然超出 token 预算时，从最早的一轮开始丢弃，至少保留最近一轮。
+    """
+    turns = split_turns(messages[summarized_count:])
+    tokens = [count_tokens_approximately(turn) for turn in turns]
+    while len(turns) > 1 and sum(tokens) > settings.SOLVING_ASSISTANT_CONTEXT_MAX_TOKENS:
+        turns.pop(0)
+        tokens.pop(0)
+    history = [message for turn in turns for message in turn]
+    if summary:
+        history.insert(0, SystemMessage(f"<之前对话的摘要>:\n{summary}"))
+    return history
+
+
+def record_context_usage(full_messages: list[AnyMessage], input_messages: list[AnyMessage]) -> tuple[int, int]:
+    tokens_before = count_tokens_approximately(full_messages)
+    tokens_after = count_tokens_approximately(input_messages)
+    context_stats["turns"] += 1
+    context_stats["tokens_before"] += tokens_before
+    context_stats["tokens_after"] += tokens_after
+    return tokens_before, tokens_after
+
+
+def messages_to_summarize(messages: list[AnyMessage], summarized_count: int) -> int:
+    """返回需要被折叠进摘要的消息数量，不需要压缩时返回 0。
+
+    未被摘要的对话轮数超过 保留轮数 + 批量轮数，或 token 数超过预算时，
+    将较早的对话折叠进摘要，直到只剩保留轮数且不超过预算（至少保留最近一轮）。
+    """
+    turns = split_turns(messages[summarized_count:])
+    tokens = [count_tokens_approximately(turn) for turn in turns]
+    keep_turns = settings.SOLVING_ASSISTANT_CONTEXT_TURNS
+    budget = settings.SOLVING_ASSISTANT_CONTEXT_MAX_TOKENS
+    if len(turns) <= keep_turns + settings.SOLVING_ASSISTANT_SUMMARY_BATCH_TURNS and sum(tokens) <= budget:
+        return 0
+    fold = 0
+    while len(turns) - fold > 1 and (len(turns) - fold > keep_turns or sum(tokens[fold:]) > budget):
+        fold += 1
+    return sum(len(turn) for turn in turns[:fold])
+
+
+async def update_summary(summary: str, messages: list[AnyMessage]) -> str:
+    """将新的对话合并到已有摘要中"""
+    # 摘要模型的输出不推送给客户端
+    model = create_model(
+        conversation_summary.model, streaming=False, priority=Priority.BACKGROUND
+    ).with_config(tags=[TAG_NOSTREAM])
+    conversations = get_buffer_string(messages, human_prefix="用户", ai_prefix="助手")
+    inputs = [
+        SystemMessage(conversation_summary.original_prompt),
+        HumanMessage(f"<已有摘要>:\n{summary or '无'}\n<新的对话>:\n{conversations}")
+    ]
+    output = await model.ainvoke(inputs)
+    context_stats["summaries"] += 1
+    return output.text.strip()
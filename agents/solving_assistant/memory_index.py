@@ -0,0 +1,266 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # 只有使用 redis 中继时才需要安装
+    redis = None
+from uvicorn.config import logger
+
+from core.config import settings
+from core.database import get_memories_by_user
+from utils.cache import TTLCache
+
+
+# 英文与数字按单词切分，连续的中文按字切分
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|[\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """英文单词与中文的字二元组（单个汉字时保留该字）"""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token[0] < "\u4e00":
+            terms.append(token)
+        elif len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+# 水平与偏好类记忆与具体问题无关，相关的记忆不足时优先用它们补足
+GENERAL_MEMORY_TYPES = {"level", "preference"}
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估算：中文约 1 字 1 token、英文约 4 字符 1 token，取折中值
+    return max(1, len(text) // 2)
+
+
+class MemoryIndex:
+    """单个用户记忆的 BM25 倒排索引，支持增量新增、更新与删除。
+
+    打分时只遍历查询词的倒排列表，与记忆总数无关。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # 记忆ID -> 记忆内容
+        self._contents: dict[int, str] = {}
+        # 记忆ID -> 是否为水平或偏好类记忆
+        self._general: dict[int, bool] = {}
+        # 记忆ID -> 词数
+        self._lengths: dict[int, int] = {}
+        # 词 -> {记忆ID: 词频}
+        self._postings: dict[str, dict[int, int]] = {}
+        self._total_length = 0
+        # 记忆ID -> 写入顺序，相关度相同时优先选择较新的记忆
+        self._recency: dict[int, int] = {}
+        self._clock = 0
+
+    def __len__(self) -> int:
+        return len(self._contents)
+
+    def __contains__(self, memory_id: int) -> bool:
+        return memory_id in self._contents
+
+    def add(self, memory_id: int, content: str, type_: str | None = None):
+        """新增或更新记忆，更新时 type_ 为 None 表示类型不变"""
+        general = self._general.get(memory_id, False) if type_ is None else type_ in GENERAL_MEMORY_TYPES
+        self.remove(memory_id)
+        self._general[memory_id] = general
+        terms = Counter(tokenize(content))
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[memory_id] = frequency
+        length = sum(terms.values())
+        self._contents[memory_id] = content
+        self._lengths[memory_id] = length
+        self._total_length += length
+        self._clock += 1
+        self._recency[memory_id] = self._clock
+
+    def remove(self, memory_id: int):
+        content = self._contents.pop(memory_id, None)
+        if content is None:
+            return
+        for term in set(tokenize(content)):
+            postings = self._postings[term]
+            del postings[memory_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(memory_id)
+        del self._recency[memory_id]
+        del self._general[memory_id]
+
+    def scores(self, query: str) -> dict[int, float]:
+        count = len(self._contents)
+        if not count:
+            return {}
+        average_length = self._total_length / count or 1
+        scores: dict[int, float] = {}
+        for term, query_frequency in Counter(tokenize(query)).items():
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for memory_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[memory_id] / average_length)
+                scores[memory_id] = scores.get(memory_id, 0.0) + query_frequency * idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def select(self, query: str, top_k: int, max_tokens: int) -> list[str]:
+        """按相关度选出至多 top_k 条记忆，总长度不超过 max_tokens；
+        相关的记忆不足时依次用水平与偏好类记忆、其余记忆补足，同类中较新的优先
+        """
+        scores = self.scores(query)
+        ranked = heapq.nlargest(
+            top_k,
+            self._contents,
+            key=lambda memory_id: (scores.get(memory_id, 0.0), self._general[memory_id], self._recency[memory_id])
+        )
+        selected, tokens = [], 0
+        for memory_id in ranked:
+            content = self._contents[memory_id]
+            cost = estimate_tokens(content)
+            if tokens + cost > max_tokens:
+                continue
+            selected.append(content)
+            tokens += cost
+        return selected
+
+
+class MemoryIndexRegistry:
+    """按用户缓存记忆索引，首次使用时从数据库构建，记忆写入后增量更新。
+
+    只有已缓存的索引会被增量更新，其余的等到下次使用时重新构建。
+    多进程部署（STREAM_RELAY=redis）时每个用户的记忆版本号保存在 Redis 中，
+    写入记忆时递增，读取索引时版本号与构建时不一致就重新构建，其它进程的写入立即可见。
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 600.0, redis_url: str | None = None, prefix: str = "smartoj-ai"):
+        # 用户ID -> (索引, 构建时的版本号)
+        self._indexes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = None
+        if redis_url is not None:
+            if redis is None:
+                raise RuntimeError("STREAM_RELAY=redis requires the redis package, install it with `uv add redis`")
+            self._redis = redis.from_url(redis_url)
+        # 每次写入记忆时递增，构建期间发生过写入时不缓存构建结果
+        self._writes = 0
+        self.builds = 0
+        self.version_errors = 0
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def version_key(self, user_id: str) -> str:
+        return f"{self.prefix}:memory-version:{user_id}"
+
+    async def _version(self, user_id: str) -> tuple[bool, int]:
+        """返回 (能否使用缓存, 当前版本号)，单进程部署时版本号恒为 0"""
+        if self._redis is None:
+            return True, 0
+        try:
+            version = await self._redis.get(self.version_key(user_id))
+        except Exception as e:
+            # 无法确认其它进程是否写入过，本次不使用也不写入缓存
+            self.version_errors += 1
+            logger.warning(f"Failed to read memory version of user {user_id}: {e}")
+            return False, 0
+        return True, int(version or 0)
+
+    async def _bump_version(self, user_id: str) -> int | None:
+        """递增版本号并返回新版本号，单进程部署时返回 None"""
+        if self._redis is None:
+            return None
+        key = self.version_key(user_id)
+        # 版本号比索引晚过期，索引过期前版本号不会丢失
+        pipeline = self._redis.pipeline(transaction=True)
+        pipeline.incr(key)
+        pipeline.expire(key, int(self.ttl) * 2)
+        version, _ = await pipeline.execute()
+        return version
+
+    async def get(self, user_id: str) -> MemoryIndex:
+        cacheable, version = await self._version(user_id)
+        cached = self._indexes.get(user_id) if cacheable else None
+        if cached is not None and cached[1] == version:
+            return cached[0]
+        writes = self._writes
+        memories = await get_memories_by_user(user_id)
+        index = MemoryIndex()
+        # 按更新时间从旧到新加入，保证写入顺序与更新时间一致
+        for memory in reversed(memories):
+            index.add(memory["id"], memory["content"], memory["type"])
+        self.builds += 1
+        if cacheable and writes == self._writes:
+            self._indexes.set(user_id, (index, version))
+        return index
+
+    async def select(self, user_id: str, query: str) -> list[str]:
+        """选出与 query 相关的记忆，数量与长度受配置限制"""
+        index = await self.get(user_id)
+        selected = index.select(
+            query, settings.SOLVING_ASSISTANT_MEMORY_TOP_K, settings.SOLVING_ASSISTANT_MEMORY_MAX_TOKENS
+        )
+        if len(selected) < len(index):
+            logger.info(f"Selected {len(selected)} of {len(index)} memories for user {user_id}")
+        return selected
+
+    async def _updatable(self, user_id: str) -> MemoryIndex | None:
+        """写入记忆后递增版本号，返回可以增量更新的本进程索引"""
+        self._writes += 1
+        cached = self._indexes.get(user_id)
+        try:
+            version = await self._bump_version(user_id)
+        except Exception as e:
+            # 记忆已经写入数据库，版本号递增失败时其它进程要等索引过期后才能看到这次写入
+            self.version_errors += 1
+            logger.warning(f"Failed to bump memory version of user {user_id}: {e}")
+            self._indexes.pop(user_id)
+            return None
+        if cached is None:
+            return None
+        if version is None:
+            return cached[0]
+        # 只有与上一个版本一致的索引可以增量更新，否则丢弃，下次使用时重新构建
+        if cached[1] != version - 1:
+            self._indexes.pop(user_id)
+            return None
+        self._indexes.set(user_id, (cached[0], version))
+        return cached[0]
+
+    async def on_saved(self, user_id: str, created: list[dict], updated: list[dict]):
+        """新增或更新记忆后调用，created 中的记忆需要带上ID"""
+        index = await self._updatable(user_id)
+        if index is None:
+            return
+        for memory in created:
+            index.add(memory["id"], memory["content"], memory["type"])
+        # 数据库只会更新属于该用户的记忆，索引同样忽略其他ID；更新只修改内容
+        for memory in updated:
+            if memory["id"] in index:
+                index.add(memory["id"], memory["content"])
+
+    async def on_deleted(self, user_id: str, memory_id: int):
+        index = await self._updatable(user_id)
+        if index is not None:
+            index.remove(memory_id)
+
+    def stats(self) -> dict[str, int]:
+        return {**self._indexes.stats(), "builds": self.builds, "version_errors": self.version_errors}
+
+
+memory_indexes = MemoryIndexRegistry(
+    maxsize=settings.MEMORY_INDEX_MAXSIZE,
+    ttl=settings.MEMORY_INDEX_TTL,
+    redis_url=settings.REDIS_URL if settings.STREAM_RELAY == "redis" else None,
+    prefix=settings.RELAY_KEY_PREFIX
+)
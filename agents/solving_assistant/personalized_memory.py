@@ -1,7 +1,7 @@
 from langchain.messages import HumanMessage, SystemMessage
 from pydantic import BaseModel
 
-from core.model import create_model
+from core.model import create_structured_model, Priority
 from core.config import settings
 
 
@@ -28,8 +28,9 @@ def deserialize(output: StructuredOutput):
 
 
 async def summarize_personalized_memory(conversations: str, memory: str = ""):
-    model = create_model(personalized_memory.model, streaming=False)
-    model = model.with_structured_output(StructuredOutput)
+    model = create_structured_model(
+        personalized_memory.model, StructuredOutput, streaming=False, priority=Priority.BACKGROUND
+    )
     humam_message = f"从下面的新对话中提取相关信息：\n{conversations}"
     if memory:
         humam_message = f"该用户已经存在部分信息了：{memory}\n" + humam_message
@@ -0,0 +1,68 @@
+"""
+对比每次请求都编译图与复用已编译图的开销。
+
+运行方式（需要与服务相同的 .env 配置，不会真正请求模型或 MCP 服务）：
+    uv run python -m benchmarks.graph_compile
+"""
+import time
+
+from langchain.agents import create_agent
+from langchain_core.tools import StructuredTool
+
+from core.model import create_model
+from agents.question_manage.agent import build_question_manage_graph, get_question_manage_graph
+from agents.question_manage.config import agent_config, tool_call_node_middlewares
+from agents.question_manage.sub_agent import context_system_prompt, SubAgentContext
+from agents.solving_assistant.agent import create_solving_assistant, get_solving_assistant
+
+
+ROUNDS = 200
+
+
+def _fake_tool(name: str) -> StructuredTool:
+    async def call_tool(**arguments):
+        return ""
+
+    return StructuredTool(
+        name=name,
+        description=name,
+        args_schema={"type": "object", "properties": {"question_id": {"type": "integer"}}},
+        coroutine=call_tool
+    )
+
+
+def _measure(label: str, func) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    elapsed = (time.perf_counter() - start) / ROUNDS * 1000
+    print(f"{label:<48}{elapsed:>10.3f} ms")
+    return elapsed
+
+
+def main():
+    test_config = agent_config["test"]
+    tools = [_fake_tool(name) for name in test_config.tools]
+    model = create_model(test_config.model)
+    cached_agent = create_agent(
+        model, tools, middleware=[context_system_prompt, *tool_call_node_middlewares], context_schema=SubAgentContext
+    )
+
+    print(f"每项执行 {ROUNDS} 次，取平均值")
+    before = _measure("question_manage 图：每次编译", build_question_manage_graph)
+    after = _measure("question_manage 图：复用并绑定检查点", get_question_manage_graph)
+    print(f"{'节省':<48}{before - after:>10.3f} ms")
+    before = _measure("solving_assistant 图：每次编译", create_solving_assistant)
+    after = _measure("solving_assistant 图：复用并绑定检查点", get_solving_assistant)
+    print(f"{'节省':<48}{before - after:>10.3f} ms")
+    before = _measure(
+        "子智能体：每次 create_agent",
+        lambda: create_agent(model, tools, system_prompt="", middleware=tool_call_node_middlewares)
+    )
+    after = _measure("子智能体：复用已编译的实例", lambda: cached_agent)
+    print(f"{'节省（每个节点调用）':<48}{before - after:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
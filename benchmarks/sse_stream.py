@@ -0,0 +1,93 @@
+"""
+对比逐片段 json.dumps 推送与合并片段 + orjson 编码两种 SSE 推送方式的帧数与 CPU 开销。
+
+模拟多个并发对话，每个对话的模型以固定间隔输出文本片段，消费端完整读取所有帧。
+CPU 开销以只读取事件流的消费端为参照扣除模拟输出的部分；实际服务中每一帧还有一次
+ASGI send 与 socket 写入，帧数减少带来的收益会比这里更明显。
+
+运行方式（需要与服务相同的 .env 配置）：
+    uv run python -m benchmarks.sse_stream
+"""
+import asyncio
+import json
+import time
+
+from core.config import settings
+from core.stream import StreamChannel
+from utils.sse import coalesce, encode_frame
+
+
+STREAMS = 200
+CHUNKS_PER_STREAM = 300
+CHUNK = "测试"
+CHUNK_INTERVAL = 0.005
+
+
+async def _produce(channel: StreamChannel, stream_id: int):
+    message_id = f"lc_run--{stream_id}"
+    for _ in range(CHUNKS_PER_STREAM):
+        await channel.put({"content": CHUNK, "id": message_id, "node": "solving_assistant", "type": "assistant"})
+        await asyncio.sleep(CHUNK_INTERVAL)
+    await channel.put(None)
+
+
+async def _drain_consumer(channel: StreamChannel) -> tuple[int, int]:
+    reader = channel.reader()
+    while (await reader.get())[1] is not None:
+        pass
+    return 0, 0
+
+
+async def _baseline_consumer(channel: StreamChannel) -> tuple[int, int]:
+    reader = channel.reader()
+    frames = size = 0
+    while True:
+        _, data = await reader.get()
+        if data is None:
+            break
+        frame = f"data: {json.dumps(data)}\n\n"
+        frames += 1
+        size += len(frame.encode())
+    return frames, size
+
+
+async def _coalesced_consumer(channel: StreamChannel) -> tuple[int, int]:
+    frames = size = 0
+    reader = channel.reader()
+    async for event_id, data in coalesce(reader, settings.SSE_COALESCE_DELAY, settings.SSE_COALESCE_MAX_CHARS):
+        frame = encode_frame(data, event_id)
+        frames += 1
+        size += len(frame)
+    return frames, size
+
+
+async def _measure(consumer) -> tuple[int, int, float, float]:
+    channels = [StreamChannel(settings.STREAM_BUFFER_SIZE) for _ in range(STREAMS)]
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    results = await asyncio.gather(
+        *(consumer(channel) for channel in channels),
+        *(_produce(channel, i) for i, channel in enumerate(channels))
+    )
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    frames = sum(result[0] for result in results[:STREAMS])
+    size = sum(result[1] for result in results[:STREAMS])
+    return frames, size, wall, cpu
+
+
+async def main():
+    print(f"{STREAMS} streams x {CHUNKS_PER_STREAM} chunks, one chunk every {CHUNK_INTERVAL * 1000:.0f} ms")
+    # 只读取事件流不编码的耗时作为参照，CPU 开销扣除模拟模型输出与事件流本身的部分
+    _, _, _, reference_cpu = await _measure(_drain_consumer)
+    for label, consumer in (
+        ("json per chunk", _baseline_consumer),
+        (f"coalesced + {settings.SSE_JSON_ENCODER}", _coalesced_consumer)
+    ):
+        frames, size, wall, cpu = await _measure(consumer)
+        print(
+            f"{label:<24}{frames:>10} frames{frames / wall:>12.0f} frames/s"
+            f"{(cpu - reference_cpu) / STREAMS * 1000:>10.3f} ms CPU/stream{size / 1024:>10.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,270 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from core.config import settings
+
+
+class AdmissionRejected(Exception):
+    """等待队列已满，retry_after 为建议的重试秒数"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, user_id: str, role: str):
+        self.user_id = user_id
+        self.role = role
+        self.admitted = False
+        self.started_at = 0.0
+        self._ready = asyncio.Event()
+
+
+class AdmissionController:
+    """智能体运行的准入控制。
+
+    同时运行的任务数受全局、角色（admin / student）与单个用户三层上限约束；
+    超出上限的任务进入有界的等待队列，按先来先服务放行（被角色或用户上限挡住的任务不阻塞后面的任务）；
+    等待队列已满或该用户排队的任务过多时直接拒绝。
+    """
+
+    def __init__(
+        self,
+        global_limit: int = 64,
+        role_limits: Optional[dict[str, int]] = None,
+        user_limits: Optional[dict[str, int]] = None,
+        queue_size: int = 128
+    ):
+        self.global_limit = global_limit
+        self.role_limits = role_limits or {}
+        self.user_limits = user_limits or {}
+        self.queue_size = queue_size
+        self._running = 0
+        self._running_by_role: dict[str, int] = {}
+        self._running_by_user: dict[str, int] = {}
+        self._waiting: deque[Ticket] = deque()
+        self._waiting_by_user: dict[str, int] = {}
+        # 任务平均运行时长的滑动平均，用于估算 Retry-After
+        self._avg_duration = 10.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @staticmethod
+    def role_of(user: dict) -> str:
+        return "admin" if user.get("is_superuser") else "student"
+
+    def _user_limit(self, role: str) -> int:
+        return self.user_limits.get(role, self.global_limit)
+
+    def _fits(self, ticket: Ticket) -> bool:
+        return (
+            self._running < self.global_limit
+            and self._running_by_role.get(ticket.role, 0) < self.role_limits.get(ticket.role, self.global_limit)
+            and self._running_by_user.get(ticket.user_id, 0) < self._user_limit(ticket.role)
+        )
+
+    def _admit(self, ticket: Ticket):
+        ticket.admitted = True
+        ticket.started_at = time.monotonic()
+        self._running += 1
+        self._running_by_role[ticket.role] = self._running_by_role.get(ticket.role, 0) + 1
+        self._running_by_user[ticket.user_id] = self._running_by_user.get(ticket.user_id, 0) + 1
+        self.admitted += 1
+        ticket._ready.set()
+
+    def retry_after(self) -> int:
+        # 按平均运行时长估算队列排空所需的时间
+        rounds = (len(self._waiting) + 1) / max(1, self.global_limit)
+        return max(1, math.ceil(self._avg_duration * rounds))
+
+    def reserve(self, user_id: str, role: str) -> Ticket:
+        """申请运行名额，能立即运行时直接放行，否则排队；无法排队时抛出 AdmissionRejected"""
+        ticket = Ticket(user_id, role)
+        # 排队中的任务都被某项上限挡住，新任务只要不触及上限就可以直接运行
+        if self._fits(ticket):
+            self._admit(ticket)
+            return ticket
+        if len(self._waiting) >= self.queue_size:
+            self.rejected += 1
+            raise AdmissionRejected("Too many agent runs in progress", self.retry_after())
+        # 每个用户排队的任务数不超过其同时运行的上限，避免单个用户占满等待队列
+        if self._waiting_by_user.get(user_id, 0) >= self._user_limit(role):
+            self.rejected += 1
+            raise AdmissionRejected("Too many agent runs for this user", self.retry_after())
+        self._waiting.append(ticket)
+        self._waiting_by_user[user_id] = self._waiting_by_user.get(user_id, 0) + 1
+        self.queued += 1
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """排队位置，从 1 开始，已放行时为 0"""
+        if ticket.admitted:
+            return 0
+        return self._waiting.index(ticket) + 1
+
+    async def wait(self, ticket: Ticket, on_position: Callable[[int], Awaitable[None]], timeout: float = 60.0):
+        """等待放行，排队位置变化时调用 on_position；超时抛出 asyncio.TimeoutError"""
+        if ticket.admitted:
+            return
+        deadline = time.monotonic() + timeout
+        position = None
+        while not ticket.admitted:
+            # 队列每次变化都会唤醒所有等待者，以便更新排队位置
+            ticket._ready.clear()
+            if position != self.position(ticket):
+                position = self.position(ticket)
+                await on_position(position)
+                if ticket.admitted:
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            try:
+                await asyncio.wait_for(ticket._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                if not ticket.admitted:
+                    raise
+        await on_position(0)
+
+    def release(self, ticket: Ticket):
+        """运行结束或放弃排队时调用"""
+        if ticket.admitted:
+            ticket.admitted = False
+            self._running -= 1
+            self._running_by_role[ticket.role] -= 1
+            self._running_by_user[ticket.user_id] -= 1
+            if not self._running_by_user[ticket.user_id]:
+                del self._running_by_user[ticket.user_id]
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.monotonic() - ticket.started_at)
+        elif ticket in self._waiting:
+            self._dequeue(ticket)
+        else:
+            return
+        self._dispatch()
+
+    def _dequeue(self, ticket: Ticket):
+        self._waiting.remove(ticket)
+        self._waiting_by_user[ticket.user_id] -= 1
+        if not self._waiting_by_user[ticket.user_id]:
+            del self._waiting_by_user[ticket.user_id]
+
+    def _dispatch(self):
+        for ticket in list(self._waiting):
+            if self._running >= self.global_limit:
+                break
+            if self._fits(ticket):
+                self._dequeue(ticket)
+                self._admit(ticket)
+        for ticket in self._waiting:
+            ticket._ready.set()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "running": self._running,
+            "waiting": len(self._waiting),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected
+        }
+
+
+class RedisAdmissionController:
+    """多进程部署（STREAM_RELAY=redis）时的准入控制，名额记录在 Redis 中，由所有接口进程共享。
+
+    运行任务在 Redis 列表中排队，同时运行的任务数已由 worker 的进程数与并发数限制，
+    因此这里限制的是全局、每个角色与单个用户在途（排队或运行中）的任务数，
+    额度与 AdmissionController 相同：运行上限加上等待队列能容纳的数量。
+    名额以运行ID记录在有序集合中，分数为过期时间，worker 异常退出时名额到期后自动归还。
+    """
+
+    # KEYS: 全局、角色、用户的有序集合；ARGV: 当前时间、过期时间、运行ID、全局、角色、用户上限
+    _RESERVE_SCRIPT = """
+        for i = 1, 3 do
+            redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', ARGV[1])
+        end
+        local running = redis.call('ZCARD', KEYS[1])
+        if running >= tonumber(ARGV[4]) then
+            return {1, running}
+        end
+        if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[5]) then
+            return {2, running}
+        end
+        if redis.call('ZCARD', KEYS[3]) >= tonumber(ARGV[6]) then
+            return {3, running}
+        end
+        for i = 1, 3 do
+            redis.call('ZADD', KEYS[i], ARGV[2], ARGV[3])
+            redis.call('EXPIRE', KEYS[i], math.ceil(ARGV[2] - ARGV[1]))
+        end
+        return {0, running}
+    """
+
+    def __init__(
+        self,
+        client,
+        prefix: str,
+        global_limit: int = 64,
+        role_limits: Optional[dict[str, int]] = None,
+        user_limits: Optional[dict[str, int]] = None,
+        queue_size: int = 128,
+        ttl: float = 600.0
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.global_limit = global_limit
+        self.role_limits = role_limits or {}
+        self.user_limits = user_limits or {}
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.admitted = 0
+        self.rejected = 0
+
+    def _keys(self, user_id: str, role: str) -> list[str]:
+        return [
+            f"{self.prefix}:admission",
+            f"{self.prefix}:admission:role:{role}",
+            f"{self.prefix}:admission:user:{user_id}"
+        ]
+
+    async def reserve(self, run_id: str, user_id: str, role: str):
+        """为运行申请名额，超出上限时抛出 AdmissionRejected"""
+        now = time.time()
+        user_limit = self.user_limits.get(role, self.global_limit)
+        code, running = await self.client.eval(
+            self._RESERVE_SCRIPT, 3, *self._keys(user_id, role),
+            now, now + self.ttl, run_id,
+            self.global_limit + self.queue_size,
+            self.role_limits.get(role, self.global_limit) + self.queue_size,
+            # 与 AdmissionController 一样，每个用户排队的任务数不超过其同时运行的上限
+            user_limit * 2
+        )
+        if code:
+            self.rejected += 1
+            # 按 AdmissionController 的初始平均运行时长估算队列排空所需的时间
+            retry_after = max(1, math.ceil(10.0 * (running + 1) / max(1, self.global_limit)))
+            if code == 3:
+                raise AdmissionRejected("Too many agent runs for this user", retry_after)
+            raise AdmissionRejected("Too many agent runs in progress", retry_after)
+        self.admitted += 1
+
+    async def release(self, run_id: str, user_id: str, role: str):
+        pipeline = self.client.pipeline(transaction=False)
+        for key in self._keys(user_id, role):
+            pipeline.zrem(key, run_id)
+        await pipeline.execute()
+
+    def stats(self) -> dict[str, int]:
+        return {"admitted": self.admitted, "rejected": self.rejected}
+
+
+admission_controller = AdmissionController(
+    global_limit=settings.ADMISSION_GLOBAL_LIMIT,
+    role_limits=settings.ADMISSION_ROLE_LIMITS,
+    user_limits=settings.ADMISSION_USER_LIMITS,
+    queue_size=settings.ADMISSION_QUEUE_SIZE
+)
@@ -1,14 +1,47 @@
-from pydantic import BaseModel
+from typing import Iterable, Literal, Optional
+
+from langchain.messages import SystemMessage
+from pydantic import BaseModel, ConfigDict
 from pydantic_settings import BaseSettings
 
 from prompts.manager import PromptManager
 
 
+class ModelPolicy(BaseModel):
+    """模型调用的延迟策略（只作用于流式请求）。
+
+    first_token_timeout：首个 token 的截止秒数，超时后向 fallback_model 再发一次请求（未配置备用模型时不切换）；
+    hedge_percentile：首个 token 的延迟超过该模型历史延迟的这一分位数时，向原模型发起一次对冲请求。
+    两者都从原请求通过网关准入后开始计时，先输出首个 token 的请求胜出，其余请求被取消。
+    """
+    model_config = ConfigDict(frozen=True)
+
+    first_token_timeout: Optional[float] = None
+    fallback_model: str = ""
+    hedge_percentile: Optional[float] = None
+
+
 class AgentConfig(BaseModel):
     model: str
     prompt_key: str
-    original_prompt: str
     tools: set[str] = set()
+    policy: Optional[ModelPolicy] = None
+
+    @property
+    def original_prompt(self) -> str:
+        """原始提示词，提示词文件修改后自动更新"""
+        return PromptManager.get_prompt(self.prompt_key)
+
+    def register_prompt_variables(self, variables: Iterable[str]):
+        """预编译提示词模板，并校验模板中的变量都在 variables 中"""
+        PromptManager.register_template(self.prompt_key, variables)
+
+    def format_prompt(self, **kwargs) -> SystemMessage:
+        return PromptManager.format(self.prompt_key, **kwargs)
+
+
+# 题目信息管理 Agent 各节点共用的延迟策略，fallback_model 为 Settings 中的字段名
+_QUESTION_MANAGE_POLICY = {"first_token_timeout": 30.0, "fallback_model": "QUESTION_MANAGE_FALLBACK_MODEL"}
 
 
 class Settings(BaseSettings):
@@ -21,6 +54,23 @@ class Settings(BaseSettings):
     # AI 服务相关配置
     OPENAI_BASE_URL: str
     OPENAI_API_KEY: str
+    # 上游模型服务的 HTTP 连接池配置
+    OPENAI_HTTP_TIMEOUT: float = 600.0
+    OPENAI_HTTP_MAX_CONNECTIONS: int = 200
+    OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    OPENAI_HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    # 模型调用网关：每个模型的初始与最大并发数（按 AIMD 自适应调整）、首个 token 的目标延迟、
+    # 遇到 429 等错误时的最大重试次数，以及按模型名称配置的每分钟 token 上限（未配置的模型不限制）
+    LLM_GATEWAY_ENABLED: bool = True
+    LLM_GATEWAY_INITIAL_CONCURRENCY: int = 8
+    LLM_GATEWAY_MAX_CONCURRENCY: int = 32
+    LLM_GATEWAY_LATENCY_TARGET: float = 5.0
+    LLM_GATEWAY_MAX_RETRIES: int = 3
+    LLM_GATEWAY_TOKENS_PER_MINUTE: dict[str, int] = {}
+
+    # 首个 token 超时后使用的备用模型，为空时向原模型重新请求
+    QUESTION_MANAGE_FALLBACK_MODEL: str = ""
+    SOLVING_ASSISTANT_FALLBACK_MODEL: str = ""
 
     # Graph Node LLM 模型配置
     # 题目信息管理 Agent 的每个节点对应的的 LLM 模型
@@ -41,6 +91,12 @@ class Settings(BaseSettings):
 
     # MCP 连接配置
     MCP_SERVER_URL: str
+    # MCP 会话池配置
+    MCP_SESSION_POOL_MAX_SIZE: int = 64
+    MCP_SESSION_IDLE_TIMEOUT: float = 300.0
+    MCP_SESSION_HEALTH_CHECK_INTERVAL: float = 60.0
+    # MCP 工具目录的刷新间隔
+    MCP_TOOL_CATALOG_TTL: float = 600.0
 
     # 后端接口地址
     BACKEND_URL: str
@@ -48,10 +104,90 @@ class Settings(BaseSettings):
     # MySQL URI
     DATABASE_URI: str
 
+    # 后端 HTTP 连接池配置
+    BACKEND_HTTP_TIMEOUT: float = 10.0
+    BACKEND_HTTP_MAX_CONNECTIONS: int = 100
+    BACKEND_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    # 用户会话缓存配置
+    USER_CACHE_TTL: float = 60.0
+    USER_CACHE_MAXSIZE: int = 4096
+    # 用户画像缓存配置（超过刷新时间后在后台刷新）
+    USER_PROFILE_CACHE_TTL: float = 600.0
+    USER_PROFILE_CACHE_REFRESH_AFTER: float = 120.0
+    USER_PROFILE_CACHE_MAXSIZE: int = 4096
+    # 对话与记忆列表接口的默认与最大分页大小
+    LIST_PAGE_SIZE: int = 20
+    LIST_MAX_PAGE_SIZE: int = 100
+    # 对话缓存配置：单个对话与每个用户对话列表的缓存有效期、不存在的对话的缓存有效期以及容量
+    CONVERSATION_CACHE_TTL: float = 60.0
+    CONVERSATION_NEGATIVE_CACHE_TTL: float = 5.0
+    CONVERSATION_CACHE_MAXSIZE: int = 8192
+    CONVERSATION_LIST_CACHE_MAXSIZE: int = 4096
+    # 题目元信息、标签与编程语言列表的缓存配置
+    QUESTION_CACHE_TTL: float = 3600.0
+    QUESTION_CACHE_MAXSIZE: int = 1024
+    # 进程内题目缓存的有效期（秒），多进程部署时其它进程的失效最多延迟这么久才可见
+    QUESTION_CACHE_LOCAL_TTL: float = 10.0
+    # 智能刷题助手的上下文配置：原样保留的对话轮数、历史对话的 token 预算，
+    # 以及超出保留轮数多少轮后才进行一次摘要
+    SOLVING_ASSISTANT_CONTEXT_TURNS: int = 6
+    SOLVING_ASSISTANT_CONTEXT_MAX_TOKENS: int = 6000
+    SOLVING_ASSISTANT_SUMMARY_BATCH_TURNS: int = 4
+    # 智能刷题助手提示词中的用户记忆：按与当前问题的相关度最多选择的条数与 token 预算，
+    # 以及每个用户记忆索引的缓存有效期与容量
+    SOLVING_ASSISTANT_MEMORY_TOP_K: int = 8
+    SOLVING_ASSISTANT_MEMORY_MAX_TOKENS: int = 200
+    MEMORY_INDEX_TTL: float = 600.0
+    MEMORY_INDEX_MAXSIZE: int = 4096
+    # 智能刷题助手回答缓存配置
+    ANSWER_CACHE_TTL: int = 86400
+    ANSWER_CACHE_MAXSIZE: int = 2048
+    ANSWER_CACHE_MAX_PER_QUESTION: int = 50
+    # 后台任务队列配置
+    BACKGROUND_JOB_WORKERS: int = 4
+    BACKGROUND_JOB_QUEUE_SIZE: int = 1000
+    BACKGROUND_JOB_MAX_ATTEMPTS: int = 3
+    # 对话标题生成时问题和回答各自的最大字符数
+    TITLE_MAX_INPUT_CHARS: int = 500
+    # SSE 推送配置：同一条消息的文本片段最多合并等待的秒数（0 表示不合并）与最大字符数，
+    # 以及事件的 JSON 编码器（orjson 或 json）
+    SSE_COALESCE_DELAY: float = 0.02
+    SSE_COALESCE_MAX_CHARS: int = 256
+    SSE_JSON_ENCODER: str = "orjson"
+    # 每个对话事件流缓冲区保留的事件数与内存上限，断线重连时从中补发；
+    # 未被读取的事件超出上限时的处理方式：drop（丢弃）、spill（写入临时文件）或 cancel（中止生成）
+    STREAM_BUFFER_SIZE: int = 2000
+    STREAM_BUFFER_MAX_BYTES: int = 1 << 20
+    STREAM_OVERFLOW_POLICY: Literal["drop", "spill", "cancel"] = "spill"
+    # 对话事件流的生命周期：创建后等待客户端读取的秒数、读取者全部断开后等待重连的秒数、
+    # 生成结束后保留的秒数，以及所有事件流缓冲数据的总上限
+    STREAM_ATTACH_TIMEOUT: float = 30.0
+    STREAM_IDLE_TIMEOUT: float = 120.0
+    STREAM_SESSION_TTL: float = 60.0
+    STREAM_MAX_TOTAL_BYTES: int = 256 << 20
+    # 智能体运行的准入控制：全局、按角色（admin / student）与单个用户同时运行的任务数上限，
+    # 等待队列的长度以及排队的最长秒数
+    ADMISSION_GLOBAL_LIMIT: int = 64
+    ADMISSION_ROLE_LIMITS: dict[str, int] = {"admin": 16, "student": 56}
+    ADMISSION_USER_LIMITS: dict[str, int] = {"admin": 4, "student": 2}
+    ADMISSION_QUEUE_SIZE: int = 128
+    ADMISSION_QUEUE_TIMEOUT: float = 60.0
+    # 智能体运行任务与事件流的中继：memory（在接口进程内运行，只能启动单个 uvicorn worker）
+    # 或 redis（由 `python -m workers` 启动的 worker 进程运行，接口进程可以水平扩展）
+    STREAM_RELAY: Literal["memory", "redis"] = "memory"
+    REDIS_URL: str = "redis://127.0.0.1:6379/0"
+    RELAY_KEY_PREFIX: str = "smartoj-ai"
+    # Redis 中事件流与运行记录的过期秒数
+    RELAY_STREAM_TTL: float = 600.0
+    # worker 进程数以及每个进程同时运行的智能体数
+    WORKER_PROCESSES: int = 2
+    WORKER_CONCURRENCY: int = 16
+
     AGENTS_CONFIG_TEMPLATE: dict[str, dict[str, dict]] = {
         "question_manage": {
             "data_preheat": {
                 "model": "QUESTION_MANAGE_DATA_PREHEAT_MODEL",
+                "policy": _QUESTION_MANAGE_POLICY,
                 "prompt_key": "question_manage.data_preheat",
                 "tools": {
                     "query_question_info", 
@@ -62,11 +198,13 @@ class Settings(BaseSettings):
             },
             "planner": {
                 "model": "QUESTION_MANAGE_PLANNER_MODEL",
+                "policy": _QUESTION_MANAGE_POLICY,
                 "prompt_key": "question_manage.planner"
             },
             "dispatcher": {
                 "prompt_key": "question_manage.dispatcher",
-                "model": "QUESTION_MANAGE_DISPATCHER_MODEL"
+                "model": "QUESTION_MANAGE_DISPATCHER_MODEL",
+                "policy": _QUESTION_MANAGE_POLICY
             },
             "solving_framework": {
                 "prompt_key": "question_manage.solving_framework",
@@ -75,7 +213,8 @@ class Settings(BaseSettings):
                     "query_solving_frameworks_of_question",
                     "update_solving_framework_for_question"
                 },
-                "model": "QUESTION_MANAGE_SOLVING_FRAMEWORK_MODEL"
+                "model": "QUESTION_MANAGE_SOLVING_FRAMEWORK_MODEL",
+                "policy": _QUESTION_MANAGE_POLICY
             },
             "judge_template_for_python": {
                 "prompt_key": "question_manage.judge_template_for_python",
@@ -86,7 +225,8 @@ class Settings(BaseSettings):
                     "query_judge_templates_of_question",
                     "update_judge_template_for_question"
                 },
-                "model": "QUESTION_MANAGE_JUDGE_TEMPLATE_FOR_PYTHON_MODEL"
+                "model": "QUESTION_MANAGE_JUDGE_TEMPLATE_FOR_PYTHON_MODEL",
+                "policy": _QUESTION_MANAGE_POLICY
             },
             "memory_time_limit": {
                 "prompt_key": "question_manage.memory_time_limit",
@@ -95,7 +235,8 @@ class Settings(BaseSettings):
                     "query_memory_time_limits_of_question",
                     "update_memory_time_limit_for_question"
                 },
-                "model": "QUESTION_MANAGE_MEMORY_TIME_LIMIT_MODEL"
+                "model": "QUESTION_MANAGE_MEMORY_TIME_LIMIT_MODEL",
+                "policy": _QUESTION_MANAGE_POLICY
             },
             "test": {
                 "prompt_key": "question_manage.test",
@@ -103,7 +244,8 @@ class Settings(BaseSettings):
                     "query_tests_of_question", 
                     "create_test_for_question"
                 },
-                "model": "QUESTION_MANAGE_TEST_MODEL"
+                "model": "QUESTION_MANAGE_TEST_MODEL",
+                "policy": _QUESTION_MANAGE_POLICY
             }
         },
         "generic": {
@@ -115,11 +257,21 @@ class Settings(BaseSettings):
         "solving_assistant": {
             "solving_assistant": {
                 "prompt_key": "solving_assistant.solving_assistant",
-                "model": "SOLVING_ASSISTANT_MODEL"
+                "model": "SOLVING_ASSISTANT_MODEL",
+                "policy": {
+                    "first_token_timeout": 15.0,
+                    "fallback_model": "SOLVING_ASSISTANT_FALLBACK_MODEL",
+                    "hedge_percentile": 0.95
+                }
             },
             "personalized_memory": {
                 "prompt_key": "solving_assistant.personalized_memory",
                 "model": "PERSONALIZED_MEMORY_MODEL"
+            },
+            # 对话摘要与个性化记忆一样属于后台总结任务，使用同一个模型
+            "conversation_summary": {
+                "prompt_key": "solving_assistant.conversation_summary",
+                "model": "PERSONALIZED_MEMORY_MODEL"
             }
         }
     }
@@ -147,16 +299,18 @@ class Settings(BaseSettings):
                 model_field = config_template.get("model")
                 model = getattr(self, model_field) if model_field else ""
                 
-                # 获取或生成原始提示词
-                prompt_key = config_template["prompt_key"]
-                original_prompt = self.get_prompt(prompt_key)
-                
-                # 创建AgentConfig
+                # 延迟策略中的备用模型同样从实例变量获取
+                policy = config_template.get("policy")
+                if policy is not None:
+                    fallback_field = policy.get("fallback_model")
+                    policy = ModelPolicy(**{**policy, "fallback_model": getattr(self, fallback_field) if fallback_field else ""})
+
+                # 创建AgentConfig，提示词由 PromptManager 统一管理
                 self.__agents_config[agent_type][agent_name] = AgentConfig(
                     model=model,
-                    prompt_key=prompt_key,
-                    original_prompt=original_prompt,
-                    tools=config_template.get("tools", set())
+                    prompt_key=config_template["prompt_key"],
+                    tools=config_template.get("tools", set()),
+                    policy=policy
                 )
         return self.__agents_config
 
@@ -1,5 +1,5 @@
 from urllib.parse import urlparse
-from typing import Any, Optional, AsyncGenerator
+from typing import Any, Awaitable, Callable, Hashable, Optional, AsyncGenerator
 from contextlib import asynccontextmanager
 
 import aiomysql
@@ -8,6 +8,9 @@ from aiomysql.pool import Pool
 from langgraph.checkpoint.mysql.aio import AIOMySQLSaver
 from langgraph.store.mysql import AIOMySQLStore
 
+from core.config import settings
+from utils.cache import TTLCache
+
 
 class ConnectionManager:
     _generic_pool: Optional[Pool] = None
@@ -75,6 +78,36 @@ async def langgraph_persistence_context():
         yield AIOMySQLSaver(conn), AIOMySQLStore(conn)
 
 
+# 对话的进程内缓存：按 thread_id 缓存单个对话（不存在的对话缓存为 {}，有效期更短），
+# 按用户缓存对话列表的第一页与对话总数；写入对话时同步更新。
+# 多进程部署时其它进程的写入要等缓存过期后才可见
+conversation_cache = TTLCache(maxsize=settings.CONVERSATION_CACHE_MAXSIZE, ttl=settings.CONVERSATION_CACHE_TTL)
+conversation_list_cache = TTLCache(maxsize=settings.CONVERSATION_LIST_CACHE_MAXSIZE, ttl=settings.CONVERSATION_CACHE_TTL)
+# 每次写入对话时递增，读取期间发生过写入时不回填缓存，避免覆盖较新的数据
+_conversation_writes = 0
+_MISSING = object()
+
+
+async def _refresh_conversation(cursor: DictCursor, conversation_id: int):
+    """写入对话后重新读取该行，同步到缓存并使该用户的对话列表失效"""
+    global _conversation_writes
+    _conversation_writes += 1
+    sql = """
+        SELECT id, title, created_at, updated_at, user_id, question_id, thread_id, is_deleted
+        FROM conversations
+        WHERE id = %s
+    """
+    await cursor.execute(sql, (conversation_id,))
+    conversation = await cursor.fetchone()
+    if conversation is None:
+        return
+    conversation_list_cache.pop(conversation["user_id"])
+    if conversation.pop("is_deleted"):
+        conversation_cache.set(conversation["thread_id"], {}, ttl=settings.CONVERSATION_NEGATIVE_CACHE_TTL)
+    else:
+        conversation_cache.set(conversation["thread_id"], conversation)
+
+
 async def create_conversation(
     title: str, 
     user_id: str, 
@@ -86,7 +119,9 @@ async def create_conversation(
         async with conn.cursor() as cursor:
             await cursor.execute(sql, (title, user_id, question_id, thread_id))
             await conn.commit()
-            return cursor.lastrowid
+            conversation_id = cursor.lastrowid
+            await _refresh_conversation(cursor, conversation_id)
+            return conversation_id
 
 
 async def delete_conversation(conversation_id: int):
@@ -95,30 +130,92 @@ async def delete_conversation(conversation_id: int):
         async with conn.cursor() as cursor:
             await cursor.execute(sql, (conversation_id,))
             await conn.commit()
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+            await _refresh_conversation(cursor, conversation_id)
+            return updated
+
+
+# 列表接口中时间字段的格式，在 SQL 中直接格式化；
+# 格式化后的字段与原字段同名，ORDER BY 中需要写明表名才会按原字段排序并使用索引
+_DATETIME_FORMAT = "'%%Y-%%m-%%d %%H:%%i:%%s'"
+
+
+def _keyset_condition(before: tuple[str, int] | None) -> tuple[str, tuple]:
+    """按 (updated_at, id) 倒序翻页的条件，before 为上一页最后一条的 (updated_at, id)"""
+    if before is None:
+        return "", ()
+    updated_at, id_ = before
+    return " AND (updated_at < %s OR (updated_at = %s AND id < %s))", (updated_at, updated_at, id_)
+
+
+async def _read_through_user_list(user_id: str, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+    """读取按用户缓存的列表数据，写入对话时该用户的缓存整体失效"""
+    cached = conversation_list_cache.get(user_id)
+    if cached is not None and key in cached:
+        return cached[key]
+    writes = _conversation_writes
+    value = await load()
+    if writes == _conversation_writes:
+        cached = conversation_list_cache.get(user_id)
+        if cached is None:
+            cached = {}
+            conversation_list_cache.set(user_id, cached)
+        cached[key] = value
+    return value
 
 
-async def get_conversations_by_user_and_question(user_id: str, question_id: int | None = None) -> list[dict]:
-    if question_id is None:
-        sql = """
-            SELECT id, title, created_at, updated_at, user_id, question_id, thread_id 
-            FROM conversations 
-            WHERE user_id = %s AND question_id is NULL AND is_deleted = FALSE
-            ORDER BY updated_at DESC
-        """
-        args = (user_id,)
+async def get_conversations_by_user_and_question(
+    user_id: str,
+    question_id: int | None = None,
+    limit: int = 20,
+    before: tuple[str, int] | None = None
+) -> list[dict]:
+    """按最近活跃时间倒序分页获取对话，只查询列表需要的字段。
+
+    before 为上一页最后一条的 (updated_at, id)，第一页会被缓存；返回的是缓存的副本，调用方可以直接修改
+    """
+    question_condition = "question_id IS NULL" if question_id is None else "question_id = %s"
+    keyset_condition, keyset_args = _keyset_condition(before)
+    sql = f"""
+        SELECT id, title, DATE_FORMAT(updated_at, {_DATETIME_FORMAT}) AS updated_at, question_id, thread_id
+        FROM conversations
+        WHERE user_id = %s AND is_deleted = FALSE AND {question_condition}{keyset_condition}
+        ORDER BY conversations.updated_at DESC, id DESC
+        LIMIT %s
+    """
+    args = (user_id, *(() if question_id is None else (question_id,)), *keyset_args, limit)
+
+    async def load() -> list[dict]:
+        async with ConnectionManager.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, args)
+                return await cursor.fetchall()
+
+    if before is None:
+        conversations = await _read_through_user_list(user_id, ("page", question_id, limit), load)
     else:
-        sql = """
-            SELECT id, title, created_at, updated_at, user_id, question_id, thread_id 
-            FROM conversations 
-            WHERE user_id = %s AND question_id = %s AND is_deleted = FALSE
-            ORDER BY updated_at DESC
-        """
-        args = (user_id, question_id)
-    async with ConnectionManager.connection() as conn:
-        async with conn.cursor() as cursor:
-            await cursor.execute(sql, args)
-            return await cursor.fetchall()
+        conversations = await load()
+    return [dict(conversation) for conversation in conversations]
+
+
+async def count_conversations_by_user_and_question(user_id: str, question_id: int | None = None) -> int:
+    """对话总数，只需要扫描 (user_id, is_deleted, question_id) 索引，结果随对话列表一起缓存"""
+    question_condition = "question_id IS NULL" if question_id is None else "question_id = %s"
+    sql = f"""
+        SELECT COUNT(*) AS count
+        FROM conversations
+        WHERE user_id = %s AND is_deleted = FALSE AND {question_condition}
+    """
+    args = (user_id,) if question_id is None else (user_id, question_id)
+
+    async def load() -> int:
+        async with ConnectionManager.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, args)
+                result = await cursor.fetchone()
+                return result["count"]
+
+    return await _read_through_user_list(user_id, ("count", question_id), load)
 
 
 async def update_conversation_title(conversation_id: int, title: str) -> bool:
@@ -127,10 +224,17 @@ async def update_conversation_title(conversation_id: int, title: str) -> bool:
         async with conn.cursor() as cursor:
             await cursor.execute(sql, (title, conversation_id))
             await conn.commit()
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+            await _refresh_conversation(cursor, conversation_id)
+            return updated
 
 
 async def get_conversation_by_thread_id(thread_id: str) -> dict:
+    """返回的是缓存的副本，调用方可以直接修改"""
+    conversation = conversation_cache.get(thread_id, _MISSING)
+    if conversation is not _MISSING:
+        return dict(conversation)
+    writes = _conversation_writes
     sql = """
         SELECT id, title, created_at, updated_at, user_id, question_id, thread_id 
         FROM conversations 
@@ -139,8 +243,11 @@ async def get_conversation_by_thread_id(thread_id: str) -> dict:
     async with ConnectionManager.connection() as conn:
         async with conn.cursor() as cursor:
             await cursor.execute(sql, (thread_id,))
-            conversation = await cursor.fetchone()
-            return conversation or {}
+            conversation = await cursor.fetchone() or {}
+    if writes == _conversation_writes:
+        ttl = None if conversation else settings.CONVERSATION_NEGATIVE_CACHE_TTL
+        conversation_cache.set(thread_id, conversation, ttl=ttl)
+    return dict(conversation)
 
 
 async def get_conversation_count() -> int:
@@ -156,31 +263,84 @@ async def get_conversation_count() -> int:
             return result["count"]
 
 
-async def create_memories(memories: list[dict], user_id: str) -> list[int]:
-    sql = "INSERT INTO memories (user_id, content, type) VALUES (%s, %s, %s)"
-    results = []
+async def _insert_memories(cursor: DictCursor, memories: list[dict], user_id: str) -> list[int]:
+    """一条多行 INSERT 写入所有记忆，按写入顺序返回新记忆的ID。
+    自增ID在 auto_increment_increment > 1 或 innodb_autoinc_lock_mode=2 时不一定连续，
+    因此在同一个事务中按 lastrowid（第一行的ID）重新查询本次写入的行
+    """
+    if not memories:
+        return []
+    sql = "INSERT INTO memories (user_id, content, type) VALUES " + ", ".join(["(%s, %s, %s)"] * len(memories))
+    args = [value for memory in memories for value in (user_id, memory["content"], memory["type"])]
+    await cursor.execute(sql, args)
+    placeholders = ", ".join(["%s"] * len(memories))
+    select_sql = f"""
+        SELECT id
+        FROM memories
+        WHERE user_id = %s AND id >= %s AND content IN ({placeholders})
+        ORDER BY id
+        LIMIT %s
+    """
+    await cursor.execute(select_sql, (user_id, cursor.lastrowid, *(memory["content"] for memory in memories), len(memories)))
+    return [row["id"] for row in await cursor.fetchall()]
+
+
+async def _update_memories(cursor: DictCursor, memories: list[dict], user_id: str):
+    """一条 UPDATE ... CASE 更新所有记忆，只会更新属于该用户的记忆"""
+    if not memories:
+        return
+    cases = " ".join(["WHEN %s THEN %s"] * len(memories))
+    placeholders = ", ".join(["%s"] * len(memories))
+    sql = f"UPDATE memories SET content = CASE id {cases} END WHERE user_id = %s AND id IN ({placeholders})"
+    args = [value for memory in memories for value in (memory["id"], memory["content"])]
+    args += [user_id, *(memory["id"] for memory in memories)]
+    await cursor.execute(sql, args)
+
+
+async def save_memories(created: list[dict], updated: list[dict], user_id: str) -> list[int]:
+    """在一个事务中新增与更新记忆，返回新增记忆的ID"""
+    if not created and not updated:
+        return []
     async with ConnectionManager.connection() as conn:
         async with conn.cursor() as cursor:
-            for memory in memories:
-                await cursor.execute(sql, (user_id, memory["content"], memory["type"]))
-                results.append(cursor.lastrowid)
+            ids = await _insert_memories(cursor, created, user_id)
+            await _update_memories(cursor, updated, user_id)
             await conn.commit()
-            return results
+            return ids
 
 
-async def get_memories_by_user(user_id: str) -> list[dict]:
-    sql = """
-        SELECT id, user_id, created_at, updated_at, content, type
+async def get_memories_by_user(
+    user_id: str,
+    limit: int | None = None,
+    before: tuple[str, int] | None = None
+) -> list[dict]:
+    """按更新时间倒序分页获取记忆，limit 为 None 时返回全部；before 的含义与对话列表相同"""
+    keyset_condition, keyset_args = _keyset_condition(before)
+    sql = f"""
+        SELECT id, content, type, DATE_FORMAT(updated_at, {_DATETIME_FORMAT}) AS updated_at
         FROM memories
-        WHERE user_id = %s
-        ORDER BY updated_at DESC
+        WHERE user_id = %s{keyset_condition}
+        ORDER BY memories.updated_at DESC, id DESC
     """
+    args = (user_id, *keyset_args)
+    if limit is not None:
+        sql += " LIMIT %s"
+        args += (limit,)
     async with ConnectionManager.connection() as conn:
         async with conn.cursor() as cursor:
-            await cursor.execute(sql, (user_id,))
+            await cursor.execute(sql, args)
             return await cursor.fetchall()
 
 
+async def count_memories_by_user(user_id: str) -> int:
+    sql = "SELECT COUNT(*) AS count FROM memories WHERE user_id = %s"
+    async with ConnectionManager.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, (user_id,))
+            result = await cursor.fetchone()
+            return result["count"]
+
+
 async def delete_memory(memory_id: int) -> bool:
     sql = "DELETE FROM memories WHERE id = %s"
     async with ConnectionManager.connection() as conn:
@@ -199,12 +359,35 @@ async def update_memory_content(memory_id: int, content: str) -> bool:
             return cursor.rowcount > 0
 
 
-async def batch_update_memories(memories: list[dict]):
-    if not memories:
-        return
-    sql = "UPDATE memories SET content = %s WHERE id = %s"
+async def get_cached_answer(cache_key: str, ttl: int) -> str | None:
+    sql = """
+        SELECT answer
+        FROM answer_cache
+        WHERE cache_key = %s AND created_at >= NOW() - INTERVAL %s SECOND
+    """
+    async with ConnectionManager.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, (cache_key, ttl))
+            result = await cursor.fetchone()
+            return result["answer"] if result else None
+
+
+async def save_cached_answer(question_id: int, cache_key: str, answer: str, max_per_question: int):
+    """保存回答，同一道题目只保留最近的 max_per_question 条"""
+    insert_sql = """
+        INSERT INTO answer_cache (question_id, cache_key, answer) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE answer = VALUES(answer), created_at = CURRENT_TIMESTAMP
+    """
+    trim_sql = """
+        DELETE FROM answer_cache
+        WHERE question_id = %s AND id NOT IN (
+            SELECT id FROM (
+                SELECT id FROM answer_cache WHERE question_id = %s ORDER BY created_at DESC, id DESC LIMIT %s
+            ) AS latest
+        )
+    """
     async with ConnectionManager.connection() as conn:
         async with conn.cursor() as cursor:
-            for memory in memories:
-                await cursor.execute(sql, (memory["content"], memory["id"]))
+            await cursor.execute(insert_sql, (question_id, cache_key, answer))
+            await cursor.execute(trim_sql, (question_id, question_id, max_per_question))
             await conn.commit()
@@ -0,0 +1,38 @@
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Optional
+
+import httpx
+
+from core.config import settings
+
+
+class HttpClientManager:
+    _client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    async def initialize(cls):
+        """初始化访问后端的共享 HTTP 客户端（长连接）"""
+        if cls._client is None:
+            cls._client = httpx.AsyncClient(
+                base_url=settings.BACKEND_URL,
+                # 客户端被所有用户共享，不能保存后端返回的 Cookie
+                cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+                timeout=settings.BACKEND_HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.BACKEND_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.BACKEND_HTTP_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+
+    @classmethod
+    async def close(cls):
+        """关闭共享 HTTP 客户端"""
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+
+    @classmethod
+    def client(cls) -> httpx.AsyncClient:
+        if cls._client is None:
+            raise RuntimeError("HttpClientManager is not initialized")
+        return cls._client
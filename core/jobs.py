@@ -0,0 +1,88 @@
+import asyncio
+import traceback
+from contextlib import suppress
+from typing import Any, Awaitable, Callable
+
+from uvicorn.config import logger
+
+from core.config import settings
+
+
+Job = Callable[..., Awaitable[Any]]
+
+
+class BackgroundJobQueue:
+    """有界的后台任务队列。
+
+    对话收尾等不影响流式响应的工作交给固定数量的 worker 执行，
+    失败的任务按指数退避重试，队列满时提交方等待，避免无限堆积。
+    """
+
+    def __init__(self, workers: int = 4, maxsize: int = 1000, max_attempts: int = 3, retry_delay: float = 1.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: asyncio.Queue[tuple[str, Job, tuple, int]] = asyncio.Queue(maxsize)
+        self._workers: list[asyncio.Task] = []
+        # 等待重试的任务
+        self._retrying: set[asyncio.Task] = set()
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self, timeout: float = 10.0):
+        """等待已提交的任务执行完毕（最多 timeout 秒）后停止 worker"""
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._queue.join(), timeout)
+        for task in [*self._workers, *self._retrying]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retrying, return_exceptions=True)
+        self._workers = []
+        self._retrying.clear()
+
+    async def submit(self, name: str, job: Job, *args):
+        await self._queue.put((name, job, args, 1))
+
+    async def _retry_later(self, name: str, job: Job, args: tuple, attempt: int):
+        await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        await self._queue.put((name, job, args, attempt + 1))
+
+    async def _work(self):
+        while True:
+            name, job, args, attempt = await self._queue.get()
+            try:
+                await job(*args)
+                self.completed += 1
+            except Exception as e:
+                if attempt < self.max_attempts:
+                    self.retried += 1
+                    logger.warning(f"Background job {name} failed (attempt {attempt}), retrying: {e}")
+                    task = asyncio.create_task(self._retry_later(name, job, args, attempt))
+                    self._retrying.add(task)
+                    task.add_done_callback(self._retrying.discard)
+                else:
+                    self.failed += 1
+                    logger.error(f"Background job {name} failed after {attempt} attempts")
+                    traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "retrying": len(self._retrying),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+
+background_jobs = BackgroundJobQueue(
+    workers=settings.BACKGROUND_JOB_WORKERS,
+    maxsize=settings.BACKGROUND_JOB_QUEUE_SIZE,
+    max_attempts=settings.BACKGROUND_JOB_MAX_ATTEMPTS
+)
@@ -0,0 +1,448 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Callable, Optional
+
+import openai
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+from uvicorn.config import logger
+
+from core.config import ModelPolicy, settings
+
+
+class Priority(IntEnum):
+    """模型调用的优先级，数值越小越先被调度"""
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+# 可以重试的上游错误，其中只有 429 会让并发上限减半
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError
+)
+
+
+def _estimate_tokens(text_length: int) -> int:
+    # 粗略估算：中文约 1 字 1 token、英文约 4 字符 1 token，取折中值
+    return text_length // 2
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelGate:
+    """单个上游模型的调度闸门。
+
+    并发上限按 AIMD 调整：请求成功且首个 token 的延迟低于目标时缓慢加一，
+    遇到 429 时减半、延迟超标时小幅下调；
+    可选的令牌桶限制每分钟消耗的 token 数，请求前按估算值扣减，完成后按实际用量修正；
+    名额释放时优先唤醒优先级最高的等待者，同一优先级按先来先服务。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_concurrency: float = 8,
+        min_concurrency: float = 1,
+        max_concurrency: float = 32,
+        tokens_per_minute: int = 0,
+        latency_target: float = 5.0
+    ):
+        self.name = name
+        self.limit = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        # (优先级, 序号, future)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        # 最近若干次请求的首个 token 延迟，用于计算对冲请求的触发时间
+        self._first_token_latencies: deque[float] = deque(maxlen=200)
+        self.completed = 0
+        self.throttled = 0
+        self.retried = 0
+        self.waited = 0
+        # 按延迟策略发起的请求数，以及其中发起对冲、改用备用模型的次数与这些请求胜出的次数
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.fallback_wins = 0
+
+    def _refill(self):
+        if not self.tokens_per_minute:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60
+        )
+        self._refilled_at = now
+
+    def _has_capacity(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self._refill()
+        return not self.tokens_per_minute or self._tokens > 0
+
+    def _dispatch(self):
+        while self._waiters and self._has_capacity():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+        # 只因令牌不足而等待时，按缺口安排下一次唤醒
+        if self._waiters and self.tokens_per_minute and self.in_flight < int(self.limit) and self._wakeup is None:
+            delay = max(0.05, -self._tokens * 60 / self.tokens_per_minute)
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    async def acquire(self, priority: int, tokens: int):
+        if not self._waiters and self._has_capacity():
+            self.in_flight += 1
+        else:
+            self.waited += 1
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+            # 令牌不足时需要安排定时唤醒
+            self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                # 已经分到名额后才被取消，归还名额
+                if future.done() and not future.cancelled():
+                    self.in_flight -= 1
+                    self._dispatch()
+                raise
+        if self.tokens_per_minute:
+            self._tokens -= tokens
+
+    def release(self, tokens_estimated: int = 0, tokens_used: Optional[int] = None):
+        self.in_flight -= 1
+        if self.tokens_per_minute and tokens_used is not None:
+            self._tokens += tokens_estimated - tokens_used
+        self._dispatch()
+
+    def on_success(self, latency: Optional[float]):
+        self.completed += 1
+        if latency is not None and latency > self.latency_target:
+            self.limit = max(self.min_concurrency, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._dispatch()
+
+    def on_rate_limited(self):
+        self.throttled += 1
+        self.limit = max(self.min_concurrency, self.limit / 2)
+
+    def observe_first_token(self, latency: float):
+        self._first_token_latencies.append(latency)
+
+    def first_token_percentile(self, percentile: float) -> Optional[float]:
+        """首个 token 延迟的分位数，样本不足时返回 None"""
+        if len(self._first_token_latencies) < 20:
+            return None
+        latencies = sorted(self._first_token_latencies)
+        return latencies[int(percentile * (len(latencies) - 1))]
+
+    def stats(self) -> dict[str, Any]:
+        p95 = self.first_token_percentile(0.95)
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "tokens": round(self._tokens) if self.tokens_per_minute else None,
+            "completed": self.completed,
+            "waited": self.waited,
+            "throttled": self.throttled,
+            "retried": self.retried,
+            "first_token_p95": round(p95, 3) if p95 is not None else None,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "fallback_wins": self.fallback_wins,
+            "hedge_rate": round(self.hedged / self.requests, 3) if self.requests else 0.0,
+            "fallback_rate": round(self.fallbacks / self.requests, 3) if self.requests else 0.0
+        }
+
+
+class LLMGateway:
+    """按模型名称管理调度闸门，所有经由 create_model 创建的模型共享"""
+
+    def __init__(
+        self,
+        initial_concurrency: int = 8,
+        max_concurrency: int = 32,
+        tokens_per_minute: Optional[dict[str, int]] = None,
+        latency_target: float = 5.0,
+        max_retries: int = 3,
+        retry_delay: float = 1.0
+    ):
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute or {}
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._gates: dict[str, ModelGate] = {}
+
+    def gate(self, model_name: str) -> ModelGate:
+        gate = self._gates.get(model_name)
+        if gate is None:
+            gate = ModelGate(
+                model_name,
+                initial_concurrency=self.initial_concurrency,
+                max_concurrency=self.max_concurrency,
+                tokens_per_minute=self.tokens_per_minute.get(model_name, 0),
+                latency_target=self.latency_target
+            )
+            self._gates[model_name] = gate
+        return gate
+
+    async def backoff(self, gate: ModelGate, error: Exception, attempt: int):
+        gate.retried += 1
+        if isinstance(error, openai.RateLimitError):
+            gate.on_rate_limited()
+        delay = _retry_after(error) or self.retry_delay * 2 ** attempt
+        logger.warning(f"LLM request to {gate.name} failed ({type(error).__name__}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    def stats(self) -> dict[str, Any]:
+        return {name: gate.stats() for name, gate in self._gates.items()}
+
+
+llm_gateway = LLMGateway(
+    initial_concurrency=settings.LLM_GATEWAY_INITIAL_CONCURRENCY,
+    max_concurrency=settings.LLM_GATEWAY_MAX_CONCURRENCY,
+    tokens_per_minute=settings.LLM_GATEWAY_TOKENS_PER_MINUTE,
+    latency_target=settings.LLM_GATEWAY_LATENCY_TARGET,
+    max_retries=settings.LLM_GATEWAY_MAX_RETRIES
+)
+
+
+async def _first_chunk(stream: AsyncIterator[ChatGenerationChunk]) -> Optional[ChatGenerationChunk]:
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class GatewayChatOpenAI(ChatOpenAI):
+    """经过 LLMGateway 调度的 ChatOpenAI，重试由网关负责，以便感知每一次 429；
+    配置了 policy 时，流式请求按首个 token 的延迟发起对冲请求或改用备用模型
+    """
+
+    priority: int = Priority.NORMAL
+    policy: Optional[ModelPolicy] = None
+
+    @asynccontextmanager
+    async def _slot(self, gate: ModelGate, tokens: int) -> AsyncIterator[dict]:
+        await gate.acquire(self.priority, tokens)
+        usage: dict = {}
+        try:
+            yield usage
+        finally:
+            gate.release(tokens, usage.get("total_tokens"))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        gate = llm_gateway.gate(self.model_name)
+        tokens = _estimate_tokens(sum(len(message.text) for message in messages)) + (self.max_tokens or 512)
+        for attempt in itertools.count():
+            try:
+                async with self._slot(gate, tokens) as usage:
+                    result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+                    usage.update((result.llm_output or {}).get("token_usage") or {})
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= llm_gateway.max_retries:
+                    raise
+                await llm_gateway.backoff(gate, e, attempt)
+                continue
+            # 非流式请求的耗时包含整段输出，不作为延迟信号
+            gate.on_success(None)
+            return result
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        if self.policy is None:
+            async for chunk in self._stream_model(self.model_name, messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+        first, stream = await self._race(messages, stop, **kwargs)
+        try:
+            if first is None:
+                return
+            # 竞速中的请求不向回调推送 token，由胜出的流补推
+            if run_manager:
+                await run_manager.on_llm_new_token(first.text, chunk=first)
+            yield first
+            async for chunk in stream:
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _stream_model(
+        self,
+        model_name: str,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        on_admitted: Optional[Callable[[], None]] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """向 model_name 发起流式请求，输出首个 chunk 之前遇到可重试的错误时退避重试；
+        每次通过网关准入、真正向上游发出请求时调用 on_admitted
+        """
+        gate = llm_gateway.gate(model_name)
+        if model_name != self.model_name:
+            kwargs["model"] = model_name
+        input_tokens = _estimate_tokens(sum(len(message.text) for message in messages))
+        tokens = input_tokens + (self.max_tokens or 512)
+        for attempt in itertools.count():
+            first_token_latency = None
+            try:
+                async with self._slot(gate, tokens) as usage:
+                    if on_admitted is not None:
+                        on_admitted()
+                    started_at = time.monotonic()
+                    output_length = 0
+                    async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+                        if first_token_latency is None:
+                            first_token_latency = time.monotonic() - started_at
+                            gate.observe_first_token(first_token_latency)
+                        output_length += len(chunk.text)
+                        usage_metadata = getattr(chunk.message, "usage_metadata", None)
+                        if usage_metadata:
+                            usage["total_tokens"] = usage_metadata["total_tokens"]
+                        yield chunk
+                    # 上游没有在流中返回用量时按输出长度估算
+                    usage.setdefault("total_tokens", input_tokens + _estimate_tokens(output_length))
+            except _RETRYABLE_ERRORS as e:
+                # 已经输出过内容的流无法重试
+                if first_token_latency is not None or attempt >= llm_gateway.max_retries:
+                    raise
+                await llm_gateway.backoff(gate, e, attempt)
+                continue
+            gate.on_success(first_token_latency)
+            return
+
+    async def _race(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        **kwargs: Any
+    ) -> tuple[Optional[ChatGenerationChunk], AsyncIterator[ChatGenerationChunk]]:
+        """按延迟策略竞速，返回最先输出的请求的首个 chunk 与它剩余的流。
+
+        原请求通过网关准入后才开始计时，与首个 token 延迟的统计口径一致，
+        网关排队时不会因为排队时间过长而发起额外的请求；
+        首个 token 的等待时间超过原模型历史延迟的分位数时，向原模型发起一次对冲请求；
+        超过截止时间，或者已发起的请求全部失败时，向备用模型发起一次请求（没有不同于原模型的备用模型时不切换）；
+        每种请求最多发起一次，先输出的请求胜出，其余请求被取消。
+        """
+        policy = self.policy
+        gate = llm_gateway.gate(self.model_name)
+        gate.requests += 1
+        loop = asyncio.get_running_loop()
+        fallback_model = policy.fallback_model if policy.fallback_model != self.model_name else ""
+        hedge_at = fallback_at = None
+        admitted = asyncio.Event()
+        admitted_waiter = asyncio.create_task(admitted.wait())
+        deadlines_set = False
+        fallback_started = False
+        # 任务 -> (请求类型, 流)
+        attempts: dict[asyncio.Task, tuple[str, AsyncIterator[ChatGenerationChunk]]] = {}
+        error: Optional[BaseException] = None
+
+        def start(kind: str, model_name: str, on_admitted: Optional[Callable[[], None]] = None):
+            stream = self._stream_model(model_name, messages, stop, None, on_admitted, **kwargs)
+            attempts[asyncio.create_task(_first_chunk(stream))] = (kind, stream)
+
+        start("primary", self.model_name, admitted.set)
+        try:
+            while True:
+                now = loop.time()
+                if admitted.is_set() and not deadlines_set:
+                    deadlines_set = True
+                    if policy.hedge_percentile:
+                        delay = gate.first_token_percentile(policy.hedge_percentile)
+                        if delay is not None:
+                            hedge_at = now + delay
+                    if policy.first_token_timeout and fallback_model:
+                        fallback_at = now + policy.first_token_timeout
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    gate.hedged += 1
+                    start("hedge", self.model_name)
+                if not fallback_started and fallback_model and (
+                    (fallback_at is not None and now >= fallback_at) or not attempts
+                ):
+                    fallback_started, fallback_at = True, None
+                    gate.fallbacks += 1
+                    logger.warning(f"LLM request to {self.model_name} falling back to {fallback_model}")
+                    start("fallback", fallback_model)
+                if not attempts:
+                    raise error
+                timeout = min((t - now for t in (hedge_at, fallback_at) if t is not None), default=None)
+                # 原请求还在网关排队时，准入后需要立即设置截止时间
+                waiting = {*attempts, admitted_waiter} if not deadlines_set else set(attempts)
+                done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is admitted_waiter:
+                        continue
+                    kind, stream = attempts.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if kind == "hedge":
+                        gate.hedge_wins += 1
+                    elif kind == "fallback":
+                        gate.fallback_wins += 1
+                    return task.result(), stream
+        finally:
+            admitted_waiter.cancel()
+            for task in attempts:
+                task.cancel()
+            await asyncio.gather(admitted_waiter, *attempts, return_exceptions=True)
+            for _, stream in attempts.values():
+                await stream.aclose()
@@ -1,6 +1,111 @@
+from typing import Any, Hashable
+
+import httpx
+from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI
 
-from core.config import settings
+from core.config import ModelPolicy, settings
+from core.llm_gateway import GatewayChatOpenAI, Priority
+
+
+def _freeze(value: Any) -> Hashable:
+    """将参数转换为可哈希的缓存键"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, Hashable):
+        return value
+    return repr(value)
+
+
+class ModelRegistry:
+    """复用 ChatOpenAI 实例与结构化输出 Runnable，同一上游共享一个 HTTP 连接池"""
+
+    _models: dict[Hashable, ChatOpenAI] = {}
+    _structured_models: dict[Hashable, Runnable] = {}
+    _http_clients: dict[str, httpx.AsyncClient] = {}
+    _stats: dict[str, int] = {"hits": 0, "misses": 0, "structured_hits": 0, "structured_misses": 0}
+
+    @classmethod
+    def http_client(cls, base_url: str) -> httpx.AsyncClient:
+        client = cls._http_clients.get(base_url)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.OPENAI_HTTP_TIMEOUT, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.OPENAI_HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+            cls._http_clients[base_url] = client
+        return client
+
+    @classmethod
+    def get_model(
+        cls,
+        model_name: str,
+        api_key: str,
+        base_url: str,
+        extra_body: dict,
+        streaming: bool,
+        **kwargs
+    ) -> ChatOpenAI:
+        key = (model_name, api_key, base_url, streaming, _freeze(extra_body), _freeze(kwargs))
+        model = cls._models.get(key)
+        if model is not None:
+            cls._stats["hits"] += 1
+            return model
+        cls._stats["misses"] += 1
+        if settings.LLM_GATEWAY_ENABLED:
+            # 重试交给网关，它需要感知每一次 429 来调整并发
+            model_class, kwargs = GatewayChatOpenAI, {"max_retries": 0, **kwargs}
+        else:
+            model_class = ChatOpenAI
+            kwargs.pop("priority", None)
+            kwargs.pop("policy", None)
+        model = model_class(
+            model=model_name,
+            api_key=api_key,
+            base_url=base_url,
+            extra_body=extra_body,
+            streaming=streaming,
+            http_async_client=cls.http_client(base_url),
+            **kwargs
+        )
+        cls._models[key] = model
+        return model
+
+    @classmethod
+    def get_structured_model(cls, model: ChatOpenAI, schema: Any, **kwargs) -> Runnable:
+        key = (id(model), _freeze(schema), _freeze(kwargs))
+        structured_model = cls._structured_models.get(key)
+        if structured_model is not None:
+            cls._stats["structured_hits"] += 1
+            return structured_model
+        cls._stats["structured_misses"] += 1
+        structured_model = model.with_structured_output(schema, **kwargs)
+        cls._structured_models[key] = structured_model
+        return structured_model
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return {
+            **cls._stats,
+            "models": len(cls._models),
+            "structured_models": len(cls._structured_models),
+            "http_clients": len(cls._http_clients)
+        }
+
+    @classmethod
+    async def close(cls):
+        """关闭所有上游连接池，已缓存的模型随之失效"""
+        for client in cls._http_clients.values():
+            await client.aclose()
+        cls._http_clients.clear()
+        cls._models.clear()
+        cls._structured_models.clear()
 
 
 def create_model(
@@ -9,18 +114,27 @@ def create_model(
     base_url: str = settings.OPENAI_BASE_URL,
     extra_body: dict = None,
     streaming: bool = True,
+    priority: Priority = Priority.NORMAL,
+    policy: ModelPolicy | None = None,
     **kwargs
 ) -> ChatOpenAI:
-    if extra_body is None:
-        extra_body = {"enable_thinking": False}
-    else:
-        if "enable_thinking" not in extra_body:
-            extra_body.update({"enable_thinking": False})
-    return ChatOpenAI(
-        model=model_name,
-        api_key=api_key,
-        base_url=base_url,
-        extra_body=extra_body,
-        streaming=streaming,
-        **kwargs
+    """创建（或复用）模型，priority 决定网关调度的先后，交互式的对话应优先于后台任务；
+    policy 为 Agent 配置中的延迟策略
+    """
+    extra_body = {"enable_thinking": False, **(extra_body or {})}
+    return ModelRegistry.get_model(
+        model_name, api_key, base_url, extra_body, streaming, priority=priority, policy=policy, **kwargs
     )
+
+
+def create_structured_model(
+    model_name: str,
+    schema: Any,
+    streaming: bool = True,
+    priority: Priority = Priority.NORMAL,
+    policy: ModelPolicy | None = None,
+    **kwargs
+) -> Runnable:
+    """创建（或复用）绑定了结构化输出的模型，kwargs 会传递给 with_structured_output"""
+    model = create_model(model_name, streaming=streaming, priority=priority, policy=policy)
+    return ModelRegistry.get_structured_model(model, schema, **kwargs)
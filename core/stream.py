@@ -0,0 +1,376 @@
+import asyncio
+import pickle
+import tempfile
+import time
+from collections import deque
+from contextlib import suppress
+from typing import IO, Any, Literal, Optional
+
+from uvicorn.config import logger
+
+from core.config import settings
+
+
+OverflowPolicy = Literal["drop", "spill", "cancel"]
+
+
+class StreamOverflowError(Exception):
+    """事件流中未被读取的数据超出内存上限，并且溢出策略为 cancel"""
+
+
+def _event_size(data: Any) -> int:
+    # 粗略估算事件占用的内存，避免为统计大小而额外编码一次
+    if isinstance(data, dict):
+        return 64 + sum(len(value) for value in data.values() if isinstance(value, str))
+    return 64
+
+
+class StreamChannel:
+    """一次对话生成过程的事件流。
+
+    事件按写入顺序编号（从 1 开始单调递增），保存在有界的环形缓冲区中，
+    同一个流可以有多个读取者，断线重连时从 Last-Event-ID 之后的事件开始补发。
+    缓冲区超出事件数或内存上限时移出最早的事件：已经被读取过的事件直接丢弃，
+    还没有任何读取者读到的事件按溢出策略处理——丢弃（drop）、写入临时文件（spill）
+    或中止生成（cancel）。落后太多的读取者从仍保留的最早事件继续读取。
+    """
+
+    def __init__(self, maxsize: int = 2000, max_bytes: int = 1 << 20, overflow: OverflowPolicy = "drop"):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        # (事件编号, 数据, 估算大小)
+        self._events: deque[tuple[int, Any, int]] = deque()
+        self._last_id = 0
+        # 所有读取者中读到的最大事件编号
+        self._delivered = 0
+        self._closed = False
+        self._released = False
+        self._changed = asyncio.Event()
+        # 溢出到临时文件的事件，编号从 _spill_first_id 开始连续
+        self._spill_file: IO[bytes] | None = None
+        self._spill_offsets: list[tuple[int, int]] = []
+        self._spill_first_id = 0
+        self.size_bytes = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def released(self) -> bool:
+        return self._released
+
+    async def put(self, data: Any):
+        # None 作为结束标记，与原先的队列用法保持一致
+        if data is None:
+            self.close()
+            return
+        if self._closed:
+            return
+        size = _event_size(data)
+        self._last_id += 1
+        self._events.append((self._last_id, data, size))
+        self.size_bytes += size
+        self._evict_overflow()
+        self._notify()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._notify()
+
+    def release(self):
+        """释放缓冲区与临时文件，之后读取者只会读到结束标记"""
+        self.close()
+        self._released = True
+        self._events.clear()
+        self.size_bytes = 0
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+            self._spill_offsets.clear()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _evict_overflow(self):
+        while len(self._events) > 1 and (len(self._events) > self.maxsize or self.size_bytes > self.max_bytes):
+            event_id, data, size = self._events[0]
+            if event_id > self._delivered:
+                if self.overflow == "cancel":
+                    raise StreamOverflowError(f"Stream buffer overflow ({self.size_bytes} bytes unread)")
+                if self.overflow == "spill":
+                    self._spill(event_id, data)
+                else:
+                    self.dropped += 1
+            self._events.popleft()
+            self.size_bytes -= size
+
+    def _spill(self, event_id: int, data: Any):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile()
+        if not self._spill_offsets or self._spill_first_id + len(self._spill_offsets) != event_id:
+            # 中间有已读后丢弃的事件，旧的溢出数据不再连续，从当前事件重新开始
+            self._spill_file.seek(0)
+            self._spill_file.truncate()
+            self._spill_offsets.clear()
+            self._spill_first_id = event_id
+        payload = pickle.dumps(data)
+        self._spill_file.seek(0, 2)
+        self._spill_offsets.append((self._spill_file.tell(), len(payload)))
+        self._spill_file.write(payload)
+        self.spilled += 1
+
+    def _read_spilled(self, event_id: int) -> Optional[tuple[int, Any]]:
+        index = event_id - self._spill_first_id
+        if self._spill_file is None or not 0 <= index < len(self._spill_offsets):
+            return None
+        offset, length = self._spill_offsets[index]
+        self._spill_file.seek(offset)
+        return event_id, pickle.loads(self._spill_file.read(length))
+
+    def _first_id(self) -> int:
+        return self._events[0][0] if self._events else self._last_id + 1
+
+    def reader(self, last_event_id: Optional[int] = None) -> "StreamReader":
+        """创建读取者，last_event_id 为客户端已收到的最后一个事件编号"""
+        return StreamReader(self, last_event_id or 0)
+
+
+class StreamReader:
+    """StreamChannel 的读取游标，接口与 asyncio.Queue 相似，读取到的是 (事件编号, 数据)。
+
+    流结束且事件都已读取后返回 (编号, None)。
+    """
+
+    def __init__(self, channel: StreamChannel, cursor: int = 0):
+        self._channel = channel
+        self._cursor = cursor
+
+    def empty(self) -> bool:
+        return self._cursor >= self._channel.last_id and not self._channel.closed
+
+    def get_nowait(self) -> tuple[int, Any]:
+        channel = self._channel
+        if self._cursor < channel.last_id and not channel.released:
+            first_id = channel._first_id()
+            event = channel._read_spilled(self._cursor + 1) if self._cursor + 1 < first_id else None
+            if event is None:
+                # 缓冲区中的事件编号连续，可以直接计算下标
+                event_id = max(self._cursor + 1, first_id)
+                event = channel._events[event_id - first_id][:2]
+            self._cursor = event[0]
+            channel._delivered = max(channel._delivered, self._cursor)
+            return event
+        if channel.closed:
+            return self._cursor, None
+        raise asyncio.QueueEmpty
+
+    async def get(self) -> tuple[int, Any]:
+        while self.empty():
+            await self._channel._changed.wait()
+        return self.get_nowait()
+
+
+class StreamSession:
+    """一次对话生成任务及其事件流"""
+
+    def __init__(self, key: str, channel: StreamChannel):
+        self.key = key
+        self.channel = channel
+        self.task: asyncio.Task | None = None
+        self.readers = 0
+        self.attached = False
+        # 已从注册表移除，等待任务结束且读取者全部断开后释放缓冲区
+        self.discarded = False
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+
+    @property
+    def finished(self) -> bool:
+        return self.task is not None and self.task.done()
+
+    def bind(self, task: asyncio.Task):
+        self.task = task
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, _: asyncio.Task):
+        # 生成任务结束（完成、异常或被取消）后关闭事件流，读取者会收到结束标记
+        self.channel.close()
+        self.last_active = time.monotonic()
+
+    def attach(self, last_event_id: Optional[int] = None) -> StreamReader:
+        self.readers += 1
+        self.attached = True
+        self.last_active = time.monotonic()
+        return self.channel.reader(last_event_id)
+
+    def detach(self):
+        self.readers -= 1
+        self.last_active = time.monotonic()
+        self._release_if_idle()
+
+    def discard(self):
+        self.discarded = True
+        if self.task is not None and not self.task.done():
+            # 任务被取消后才释放缓冲区，读取者先收到结束标记
+            self.task.add_done_callback(lambda _: self._release_if_idle())
+        self._release_if_idle()
+
+    def _release_if_idle(self):
+        if self.discarded and not self.readers and (self.task is None or self.task.done()):
+            self.channel.release()
+
+    def cancel(self) -> bool:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            return True
+        return False
+
+
+class StreamSessionRegistry:
+    """对话事件流的注册表。
+
+    创建后超过 attach_timeout 秒仍没有客户端读取、或者所有读取者断开超过 idle_timeout 秒的
+    生成任务视为无人认领（orphaned），会被取消以释放数据库连接；
+    已结束的会话在最后一次读取后保留 ttl 秒供断线重连；
+    所有会话缓冲的数据超过 max_total_bytes 时，优先淘汰已结束且无人读取的会话。
+    """
+
+    def __init__(
+        self,
+        attach_timeout: float = 30.0,
+        idle_timeout: float = 120.0,
+        ttl: float = 60.0,
+        max_total_bytes: int = 256 << 20,
+        buffer_size: int = 2000,
+        buffer_max_bytes: int = 1 << 20,
+        overflow: OverflowPolicy = "drop"
+    ):
+        self.attach_timeout = attach_timeout
+        self.idle_timeout = idle_timeout
+        self.ttl = ttl
+        self.max_total_bytes = max_total_bytes
+        self.buffer_size = buffer_size
+        self.buffer_max_bytes = buffer_max_bytes
+        self.overflow = overflow
+        self._sessions: dict[str, StreamSession] = {}
+        self._reaper: asyncio.Task | None = None
+        self.created = 0
+        self.orphaned = 0
+        self.expired = 0
+        self.evicted = 0
+
+    async def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_sessions())
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._reaper
+            self._reaper = None
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            session.cancel()
+        await asyncio.gather(*(session.task for session in sessions if session.task), return_exceptions=True)
+        for session in sessions:
+            session.channel.release()
+
+    def create(self, key: str) -> StreamSession:
+        previous = self._sessions.get(key)
+        if previous is not None:
+            # 同一个对话重新提问，取消仍在进行的上一次生成，避免两个任务同时写入检查点
+            if previous.cancel():
+                logger.info("任务<%s>被新的请求替换", key)
+            self._discard(previous)
+            self.evicted += 1
+        channel = StreamChannel(self.buffer_size, self.buffer_max_bytes, self.overflow)
+        session = StreamSession(key, channel)
+        self._sessions[key] = session
+        self.created += 1
+        self._evict_overflow()
+        return session
+
+    def get(self, key: str) -> Optional[StreamSession]:
+        return self._sessions.get(key)
+
+    def _discard(self, session: StreamSession):
+        if self._sessions.get(session.key) is session:
+            del self._sessions[session.key]
+        # 仍有读取者时由最后一个读取者断开时释放，避免读取中的缓冲区被清空
+        session.discard()
+
+    def _total_bytes(self) -> int:
+        return sum(session.channel.size_bytes for session in self._sessions.values())
+
+    def _evict_overflow(self):
+        total_bytes = self._total_bytes()
+        if total_bytes <= self.max_total_bytes:
+            return
+        finished = [session for session in self._sessions.values() if session.finished and not session.readers]
+        for session in sorted(finished, key=lambda session: session.last_active):
+            if total_bytes <= self.max_total_bytes:
+                break
+            total_bytes -= session.channel.size_bytes
+            self._discard(session)
+            self.evicted += 1
+
+    def _reap(self):
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            if session.readers:
+                continue
+            idle = now - session.last_active
+            if session.finished:
+                if idle > self.ttl:
+                    self._discard(session)
+                    self.expired += 1
+            elif session.task is not None:
+                timeout = self.idle_timeout if session.attached else self.attach_timeout
+                if idle > timeout and session.cancel():
+                    logger.info("任务<%s>无人读取，已取消", session.key)
+                    self.orphaned += 1
+        self._evict_overflow()
+
+    async def _reap_sessions(self):
+        interval = max(1.0, min(self.attach_timeout, self.ttl) / 4)
+        while True:
+            await asyncio.sleep(interval)
+            self._reap()
+
+    def stats(self) -> dict[str, int]:
+        sessions = list(self._sessions.values())
+        return {
+            "live": sum(1 for session in sessions if not session.finished),
+            "finished": sum(1 for session in sessions if session.finished),
+            "readers": sum(session.readers for session in sessions),
+            "buffered_bytes": self._total_bytes(),
+            "dropped_events": sum(session.channel.dropped for session in sessions),
+            "spilled_events": sum(session.channel.spilled for session in sessions),
+            "created": self.created,
+            "orphaned": self.orphaned,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+
+stream_sessions = StreamSessionRegistry(
+    attach_timeout=settings.STREAM_ATTACH_TIMEOUT,
+    idle_timeout=settings.STREAM_IDLE_TIMEOUT,
+    ttl=settings.STREAM_SESSION_TTL,
+    max_total_bytes=settings.STREAM_MAX_TOTAL_BYTES,
+    buffer_size=settings.STREAM_BUFFER_SIZE,
+    buffer_max_bytes=settings.STREAM_BUFFER_MAX_BYTES,
+    overflow=settings.STREAM_OVERFLOW_POLICY
+)
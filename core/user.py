@@ -1,20 +1,42 @@
-import httpx
+import asyncio
+
 from fastapi import Cookie, HTTPException, Depends
+from uvicorn.config import logger
 
 from core.config import settings
+from core.http import HttpClientManager
+from utils.cache import TTLCache
+
+
+# session_id -> 用户信息
+user_cache = TTLCache(maxsize=settings.USER_CACHE_MAXSIZE, ttl=settings.USER_CACHE_TTL)
+# user_id -> 用户画像
+user_profile_cache = TTLCache(
+    maxsize=settings.USER_PROFILE_CACHE_MAXSIZE,
+    ttl=settings.USER_PROFILE_CACHE_TTL
+)
+# 正在后台刷新用户画像的任务
+_profile_refresh_tasks: dict[str, asyncio.Task] = {}
+
+
+async def _backend_get(path: str, session_id: str):
+    client = HttpClientManager.client()
+    response = await client.get(path, headers={"Cookie": f"session_id={session_id}"})
+    if response.status_code == 401:
+        user_cache.pop(session_id)
+        raise HTTPException(status_code=401, detail="Unauthorized Failed")
+    return response.json()["data"]
 
 
 async def get_current_user(session_id: str = Cookie()) -> dict:
     if not session_id:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(settings.BACKEND_URL + "/user", cookies={"session_id": session_id})
-    if response.status_code == 401:
-        raise HTTPException(status_code=401, detail="Unauthorized Failed")
-    json_data = response.json()
-    user = json_data["data"]
-    user["session_id"] = session_id
-    return user
+    user = user_cache.get(session_id)
+    if user is None:
+        user = await _backend_get("/user", session_id)
+        user["session_id"] = session_id
+        user_cache.set(session_id, user)
+    return user.copy()
 
 
 def get_admin_user(user: dict = Depends(get_current_user)):
@@ -23,10 +45,31 @@ def get_admin_user(user: dict = Depends(get_current_user)):
     return user
 
 
-async def get_user_profile(session_id: str = Cookie()):
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(settings.BACKEND_URL + "/recommendation/user-profile", cookies={"session_id": session_id})
-    if response.status_code == 401:
-        raise HTTPException(status_code=401, detail="Unauthorized Failed")
-    json_data = response.json()
-    return json_data["data"]
+async def _fetch_user_profile(user_id: str, session_id: str) -> dict:
+    profile = await _backend_get("/recommendation/user-profile", session_id) or {}
+    user_profile_cache.set(user_id, profile)
+    return profile
+
+
+def _refresh_done_callback(user_id: str, task: asyncio.Task):
+    _profile_refresh_tasks.pop(user_id, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("刷新用户<%s>画像失败：%r", user_id, task.exception())
+
+
+async def get_cached_user_profile(user_id: str, session_id: str) -> dict:
+    """获取用户画像，优先使用缓存，缓存较旧时在后台刷新；获取失败时返回空画像"""
+    profile = user_profile_cache.get(user_id)
+    if profile is None:
+        try:
+            return await _fetch_user_profile(user_id, session_id)
+        except Exception as e:
+            # 画像只用于个性化回答，后端出错（未登录、5xx 或缺少 data 字段）时不影响本次回答
+            logger.warning("获取用户<%s>画像失败：%r", user_id, e)
+            return {}
+    age = user_profile_cache.age(user_id)
+    if age > settings.USER_PROFILE_CACHE_REFRESH_AFTER and user_id not in _profile_refresh_tasks:
+        task = asyncio.create_task(_fetch_user_profile(user_id, session_id))
+        task.add_done_callback(lambda t: _refresh_done_callback(user_id, t))
+        _profile_refresh_tasks[user_id] = task
+    return profile
@@ -3,24 +3,21 @@ from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 
-from core.database import ConnectionManager, langgraph_persistence_context
-from core.config import settings
+from workers.relay import stream_relay
+from workers.runtime import agent_runtime
 from routes.chat import router as chat_router
 from routes.conversation import router as conversation_router
 from routes.memory import router as memory_router
+from routes.metrics import router as metrics_router
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    await ConnectionManager.initialize(settings.DATABASE_URI)
-    async with langgraph_persistence_context() as (checkpointer, _):
-        await checkpointer.setup()
-        yield {
-            "stream_queues": {},
-            "stream_tasks": {},
-            "interrupted_tasks": set()
-        }
-    await ConnectionManager.close()
+    async with agent_runtime():
+        await stream_relay.start()
+        yield {"stream_relay": stream_relay}
+        # 取消仍在进行的生成任务，它们持有数据库连接
+        await stream_relay.close()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -28,6 +25,7 @@ app = FastAPI(lifespan=lifespan)
 app.include_router(chat_router)
 app.include_router(conversation_router)
 app.include_router(memory_router)
+app.include_router(metrics_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Callable, Iterable
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from mcp.types import ServerNotification, ToolListChangedNotification
+from mcp.types import Tool as MCPTool
+
+from .pool import MCPSessionPool
+from .sessions import Connection
+from .tools import _list_all_tools, convert_mcp_tool_to_langchain_tool
+
+
+class MCPToolCatalog:
+    """进程级的 MCP 工具目录。
+
+    工具定义只在启动、过期或服务端通知 `tools/list_changed` 时重新拉取，
+    每个工具在同一版本的目录中只构建一次 LangChain 工具，由所有会话共享，调用时才解析当前连接（会话请求头）。
+    """
+
+    def __init__(self, pool: MCPSessionPool, ttl: float = 600.0):
+        self.pool = pool
+        self.ttl = ttl
+        self._tools: dict[str, MCPTool] = {}
+        self._fetched_at: float | None = None
+        self._lock = asyncio.Lock()
+        # 当前版本目录下共享的工具实例
+        self._shared_tools: dict[str, BaseTool] = {}
+        self._shared_version = 0
+        self.version = 0
+        self.fetches = 0
+
+    @property
+    def stale(self) -> bool:
+        return self._fetched_at is None or time.monotonic() - self._fetched_at > self.ttl
+
+    def invalidate(self):
+        self._fetched_at = None
+
+    async def message_handler(self, message):
+        """作为 ClientSession 的 message_handler，工具列表变化时使目录失效"""
+        if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+            self.invalidate()
+
+    async def refresh(self, connection: Connection):
+        async with self.pool.session(connection) as session:
+            tools = await _list_all_tools(session)
+        self._tools = {tool.name: tool for tool in tools}
+        self._fetched_at = time.monotonic()
+        self.version += 1
+        self.fetches += 1
+
+    async def ensure_fresh(self, connection: Connection):
+        if not self.stale:
+            return
+        async with self._lock:
+            # 等待锁期间可能已被其他请求刷新
+            if self.stale:
+                await self.refresh(connection)
+
+    def get_shared_tools(
+        self,
+        names: Iterable[str],
+        connection_resolver: Callable[[RunnableConfig], Connection]
+    ) -> list[BaseTool]:
+        """返回可被不同会话共享的工具，连接在每次调用时从 RunnableConfig 中解析。
+
+        同一版本的目录中每个工具只构建一次，目录刷新后重新构建。
+        """
+        if self._shared_version != self.version:
+            self._shared_tools = {}
+            self._shared_version = self.version
+        tools = []
+        for name in names:
+            if name not in self._tools:
+                continue
+            if name not in self._shared_tools:
+                self._shared_tools[name] = convert_mcp_tool_to_langchain_tool(
+                    None, self._tools[name], pool=self.pool, connection_resolver=connection_resolver
+                )
+            tools.append(self._shared_tools[name])
+        return tools
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._tools), "version": self.version, "fetches": self.fetches}
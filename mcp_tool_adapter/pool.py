@@ -0,0 +1,201 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, Hashable
+
+from mcp import ClientSession
+from mcp.types import CallToolResult
+
+from .sessions import Connection, create_session
+
+
+class _PooledSession:
+    """一个长期存活的 MCP 会话。
+
+    MCP 的传输层依赖 anyio 的任务组，它必须在同一个任务中进入和退出，
+    因此每个会话都运行在独立的后台任务中，直到被关闭或连接断开。
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.session: ClientSession | None = None
+        self.in_use = 0
+        self.retired = False
+        self.last_used = time.monotonic()
+        self.last_checked = time.monotonic()
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: BaseException | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self, timeout: float):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            raise
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self):
+        try:
+            async with create_session(self.connection) as session:
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def close(self):
+        self._closing.set()
+        if self._task is None:
+            return
+        with suppress(Exception, asyncio.CancelledError):
+            await asyncio.wait_for(self._task, 5)
+
+
+class MCPSessionPool:
+    """按 `backend-session-id` 复用的 MCP 会话池。
+
+    会话在首次使用时建立并完成 `initialize` 握手，之后的工具调用直接复用；
+    空闲过久的会话会被回收，超出容量时淘汰最久未使用的空闲会话，
+    复用前会对长时间未检查的会话进行 ping 检查，失效的会话会被重新建立。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 64,
+        idle_timeout: float = 300.0,
+        health_check_interval: float = 60.0,
+        connect_timeout: float = 30.0
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_timeout = connect_timeout
+        self._sessions: OrderedDict[Hashable, _PooledSession] = OrderedDict()
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+        self._reaper: asyncio.Task | None = None
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @staticmethod
+    def connection_key(connection: Connection) -> Hashable:
+        headers = connection.get("headers") or {}
+        return connection["url"], headers.get("backend-session-id")
+
+    async def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_idle_sessions())
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._reaper
+            self._reaper = None
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        self._locks.clear()
+        await asyncio.gather(*(pooled.close() for pooled in sessions))
+
+    async def _reap_idle_sessions(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, pooled in list(self._sessions.items()):
+                if pooled.in_use:
+                    continue
+                if not pooled.alive or now - pooled.last_used > self.idle_timeout:
+                    await self._discard(key, pooled)
+            for key, lock in list(self._locks.items()):
+                if key not in self._sessions and not lock.locked():
+                    del self._locks[key]
+
+    async def _discard(self, key: Hashable, pooled: _PooledSession):
+        if self._sessions.get(key) is pooled:
+            del self._sessions[key]
+            self.evicted += 1
+        pooled.retired = True
+        # 仍有调用在使用该会话时，等最后一个调用结束后再关闭
+        if pooled.in_use == 0:
+            await pooled.close()
+
+    async def _evict_overflow(self):
+        for key, pooled in list(self._sessions.items()):
+            if len(self._sessions) < self.max_size:
+                return
+            if pooled.in_use == 0:
+                await self._discard(key, pooled)
+
+    async def _is_healthy(self, pooled: _PooledSession) -> bool:
+        if not pooled.alive:
+            return False
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return True
+        try:
+            await asyncio.wait_for(pooled.session.send_ping(), 5)
+        except Exception:
+            return False
+        pooled.last_checked = time.monotonic()
+        return True
+
+    async def _acquire(self, connection: Connection) -> _PooledSession:
+        key = self.connection_key(connection)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            pooled = self._sessions.get(key)
+            if pooled is not None:
+                if await self._is_healthy(pooled):
+                    self._sessions.move_to_end(key)
+                    self.reused += 1
+                    return pooled
+                await self._discard(key, pooled)
+            await self._evict_overflow()
+            pooled = _PooledSession(connection)
+            await pooled.start(self.connect_timeout)
+            self._sessions[key] = pooled
+            self.created += 1
+            return pooled
+
+    @asynccontextmanager
+    async def session(self, connection: Connection) -> AsyncIterator[ClientSession]:
+        pooled = await self._acquire(connection)
+        pooled.in_use += 1
+        try:
+            yield pooled.session
+        except Exception:
+            # 传输层异常，以及超时、服务端会话失效等协议错误（McpError）都可能让会话不可用，
+            # 直接丢弃会话，下次调用会重新建立连接
+            await self._discard(self.connection_key(connection), pooled)
+            raise
+        finally:
+            pooled.in_use -= 1
+            pooled.last_used = time.monotonic()
+            if pooled.retired and pooled.in_use == 0:
+                await pooled.close()
+
+    async def call_tool(self, connection: Connection, name: str, arguments: dict[str, Any]) -> CallToolResult:
+        async with self.session(connection) as session:
+            return await session.call_tool(name, arguments)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._sessions),
+            "in_use": sum(1 for pooled in self._sessions.values() if pooled.in_use),
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted
+        }
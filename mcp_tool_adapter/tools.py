@@ -1,14 +1,16 @@
-from typing import Any, cast
+from typing import Any, Callable, cast
 
 from mcp import ClientSession
 from mcp.types import CallToolResult, EmbeddedResource, ImageContent, TextContent
 from mcp.types import Tool as MCPTool
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import (
     BaseTool,
     StructuredTool,
     ToolException
 )
 
+from .pool import MCPSessionPool
 from .sessions import ClientSession, Connection, create_session
 
 
@@ -92,6 +94,8 @@ def convert_mcp_tool_to_langchain_tool(
     tool: MCPTool,
     *,
     connection: Connection | None = None,
+    pool: MCPSessionPool | None = None,
+    connection_resolver: Callable[[RunnableConfig], Connection] | None = None,
 ) -> BaseTool:
     """Convert an MCP tool to a LangChain tool.
 
@@ -102,20 +106,28 @@ def convert_mcp_tool_to_langchain_tool(
         tool: MCP tool to convert
         connection: Optional connection config to use to create a new session
                     if a `session` is not provided
+        pool: Optional session pool; when given together with `connection`,
+              tool calls reuse a pooled session instead of creating one per call
+        connection_resolver: Optional callable that builds the connection config
+              from the `RunnableConfig` of each tool call, so that one tool
+              instance can be shared by different backend sessions
 
     Returns:
         a LangChain tool
 
     """
-    if session is None and connection is None:
+    if session is None and connection is None and connection_resolver is None:
         msg = "Either a session or a connection config must be provided"
         raise ValueError(msg)
 
-    async def call_tool(
-        **arguments: dict[str, Any],
+    async def _call_tool(
+        connection: Connection | None,
+        arguments: dict[str, Any],
     ) -> tuple[str | list[str], list[NonTextContent] | None]:
         call_tool_result = None
-        if session is None:
+        if session is None and pool is not None:
+            call_tool_result = await pool.call_tool(connection, tool.name, arguments)
+        elif session is None:
             # If a session is not provided, we will create one on the fly
             async with create_session(connection) as tool_session:
                 await tool_session.initialize()
@@ -136,6 +148,18 @@ def convert_mcp_tool_to_langchain_tool(
 
         return _convert_call_tool_result(call_tool_result)
 
+    if connection_resolver is None:
+        async def call_tool(
+            **arguments: dict[str, Any],
+        ) -> tuple[str | list[str], list[NonTextContent] | None]:
+            return await _call_tool(connection, arguments)
+    else:
+        async def call_tool(
+            config: RunnableConfig,
+            **arguments: dict[str, Any],
+        ) -> tuple[str | list[str], list[NonTextContent] | None]:
+            return await _call_tool(connection_resolver(config), arguments)
+
     meta = tool.meta if hasattr(tool, "meta") else None
     base = tool.annotations.model_dump() if tool.annotations is not None else {}
     meta = {"_meta": meta} if meta is not None else {}
@@ -155,12 +179,14 @@ async def load_mcp_tools(
     session: ClientSession | None,
     *,
     connection: Connection | None = None,
+    pool: MCPSessionPool | None = None,
 ) -> list[BaseTool]:
     """Load all available MCP tools and convert them to LangChain tools.
 
     Args:
         session: The MCP client session. If None, connection must be provided.
         connection: Connection config to create a new session if session is None.
+        pool: Optional session pool used instead of one-off sessions.
 
     Returns:
         List of LangChain tools. Tool annotations are returned as part
@@ -173,7 +199,10 @@ async def load_mcp_tools(
         msg = "Either a session or a connection config must be provided"
         raise ValueError(msg)
 
-    if session is None:
+    if session is None and pool is not None:
+        async with pool.session(connection) as tool_session:
+            tools = await _list_all_tools(tool_session)
+    elif session is None:
         # If a session is not provided, we will create one on the fly
         async with create_session(connection) as tool_session:
             await tool_session.initialize()
@@ -182,6 +211,6 @@ async def load_mcp_tools(
         tools = await _list_all_tools(session)
 
     return [
-        convert_mcp_tool_to_langchain_tool(session, tool, connection=connection)
+        convert_mcp_tool_to_langchain_tool(session, tool, connection=connection, pool=pool)
         for tool in tools
     ]
@@ -1,25 +1,44 @@
 import os
+import time
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable
+
+from langchain.messages import SystemMessage
+from langchain_core.prompts import SystemMessagePromptTemplate
+from uvicorn.config import logger
 
 
 class PromptManager:
-    """管理所有提示词的类，自动加载 prompts 目录下的所有提示词文件"""
-    
+    """管理所有提示词的类，自动加载 prompts 目录下的所有提示词文件。
+
+    需要填充变量的提示词会被预编译为模板，并在启动时校验模板变量；
+    提示词文件在磁盘上被修改后会自动重新加载，不需要重启服务。
+    """
+
     _instance = None
     _prompts: Dict[str, str] = {}
-    
+    # 提示词文件的路径与修改时间
+    _files: Dict[str, tuple[Path, float]] = {}
+    # 已编译的模板
+    _templates: Dict[str, SystemMessagePromptTemplate] = {}
+    # 模板允许使用的变量，重新加载时据此校验
+    _variables: Dict[str, frozenset[str]] = {}
+    # 两次检查文件变化的最小间隔（秒）
+    reload_interval: float = 2.0
+    _checked_at: float = 0.0
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance._load_prompts()
         return cls._instance
-    
+
     def _load_prompts(self):
         """自动加载 prompts 目录下的所有提示词文件"""
         prompts_dir = Path(__file__).parent
         self._traverse_directory(prompts_dir)
-    
+        self._checked_at = time.monotonic()
+
     def _traverse_directory(self, directory: Path):
         """遍历目录，加载所有提示词文件"""
         for item in directory.iterdir():
@@ -30,20 +49,80 @@ class PromptManager:
                 # 加载提示词文件
                 relative_path = item.relative_to(Path(__file__).parent)
                 prompt_key = str(relative_path.with_suffix('')).replace(os.sep, '.')
-                self._prompts[prompt_key] = item.read_text(encoding='utf-8').strip()
-    
+                mtime = item.stat().st_mtime
+                if prompt_key in self._files and self._files[prompt_key][1] == mtime:
+                    continue
+                self._set_prompt(prompt_key, item.read_text(encoding='utf-8').strip())
+                self._files[prompt_key] = (item, mtime)
+
+    def _set_prompt(self, key: str, prompt: str):
+        if key in self._variables:
+            try:
+                template = self._compile(key, prompt, self._variables[key])
+            except ValueError as e:
+                # 修改后的模板不合法时继续使用旧版本
+                logger.error(f"Failed to reload prompt {key}: {e}")
+                return
+            self._templates[key] = template
+        else:
+            self._templates.pop(key, None)
+        self._prompts[key] = prompt
+
+    @staticmethod
+    def _compile(key: str, prompt: str, variables: frozenset[str]) -> SystemMessagePromptTemplate:
+        template = SystemMessagePromptTemplate.from_template(prompt)
+        unknown = set(template.input_variables) - variables
+        if unknown:
+            raise ValueError(f"Prompt {key} uses unknown variables: {sorted(unknown)}")
+        return template
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        self._traverse_directory(Path(__file__).parent)
+
     @classmethod
     def get_prompt(cls, key: str) -> str:
         """根据键名获取提示词内容"""
         instance = cls()
+        instance._reload_if_changed()
         return instance._prompts.get(key, '')
-    
+
+    @classmethod
+    def register_template(cls, key: str, variables: Iterable[str]) -> SystemMessagePromptTemplate:
+        """将提示词编译为模板，模板中使用了 variables 以外的变量时抛出 ValueError"""
+        instance = cls()
+        if key not in instance._prompts:
+            raise ValueError(f"Prompt {key} does not exist")
+        variables = frozenset(variables)
+        template = cls._compile(key, instance._prompts[key], variables)
+        instance._variables[key] = variables
+        instance._templates[key] = template
+        return template
+
+    @classmethod
+    def get_template(cls, key: str) -> SystemMessagePromptTemplate:
+        instance = cls()
+        instance._reload_if_changed()
+        template = instance._templates.get(key)
+        if template is None:
+            template = SystemMessagePromptTemplate.from_template(instance._prompts.get(key, ''))
+            instance._templates[key] = template
+        return template
+
+    @classmethod
+    def format(cls, key: str, **kwargs) -> SystemMessage:
+        """使用预编译的模板格式化系统提示词"""
+        return cls.get_template(key).format(**kwargs)
+
     @classmethod
     def list_prompts(cls) -> Dict[str, str]:
         """列出所有提示词"""
         instance = cls()
         return instance._prompts.copy()
-    
+
     @property
     def prompts(self) -> Dict[str, str]:
         """获取所有提示词的属性"""
@@ -1,17 +1,22 @@
+import asyncio
+
 from langchain_core.runnables import RunnableConfig
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
 
+from core.config import settings
 from core.database import (
     get_conversation_by_thread_id, 
     get_conversations_by_user_and_question,
+    count_conversations_by_user_and_question,
     update_conversation_title,
     delete_conversation,
     langgraph_persistence_context,
     get_conversation_count
 )
 from core.user import get_admin_user, get_current_user
-from agents.question_manage.agent import build_question_manage_graph
-from agents.solving_assistant.agent import create_solving_assistant
+from utils.pagination import decode_cursor, paginate
+from agents.question_manage.agent import get_question_manage_graph
+from agents.solving_assistant.agent import get_solving_assistant
 
 
 router = APIRouter(prefix="/conversation")
@@ -20,13 +25,26 @@ router = APIRouter(prefix="/conversation")
 @router.get("/list")
 async def get_conversations(
     user: dict = Depends(get_current_user), 
-    question_id: int = Query(None)
+    question_id: int = Query(None),
+    limit: int = Query(settings.LIST_PAGE_SIZE, ge=1, le=settings.LIST_MAX_PAGE_SIZE),
+    cursor: str = Query(None)
 ):
-    conversations = await get_conversations_by_user_and_question(user["user_id"], question_id)
-    for conversation in conversations:
-        conversation["created_at"] = conversation["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-        conversation["updated_at"] = conversation["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
-    return {"conversations": conversations}
+    """按最近活跃时间倒序分页，cursor 为上一页返回的 next_cursor；total 只在第一页返回"""
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    user_id = user["user_id"]
+    if before is None:
+        conversations, total = await asyncio.gather(
+            get_conversations_by_user_and_question(user_id, question_id, limit + 1),
+            count_conversations_by_user_and_question(user_id, question_id)
+        )
+    else:
+        conversations = await get_conversations_by_user_and_question(user_id, question_id, limit + 1, before)
+        total = None
+    conversations, next_cursor = paginate(conversations, limit)
+    return {"conversations": conversations, "next_cursor": next_cursor, "total": total}
 
 
 @router.get("")
@@ -82,7 +100,7 @@ async def get_question_manage_agent_conversation_detail(
         raise HTTPException(status_code=403, detail="Forbidden")
     config = RunnableConfig(configurable={"thread_id": thread_id})
     async with langgraph_persistence_context() as (checkpointer, store):
-        graph = build_question_manage_graph(checkpointer, store)
+        graph = get_question_manage_graph(checkpointer, store)
         snapshot = await graph.aget_state(config)
     message_type_mapping = {
         "human": "user",
@@ -115,13 +133,13 @@ async def get_solving_assistant_agent_conversation_detail(
     question_id: int = Query(),
     user: dict = Depends(get_current_user)
 ):
-    conversations = await get_conversations_by_user_and_question(user["user_id"], question_id)
+    conversations = await get_conversations_by_user_and_question(user["user_id"], question_id, limit=1)
     if not conversations:
         return {"details": [], "thread_id": ""}
     conversation = conversations[0]
     config = RunnableConfig(configurable={"thread_id": conversation["thread_id"]})
     async with langgraph_persistence_context() as (checkpointer, store):
-        graph = create_solving_assistant(checkpointer, store)
+        graph = get_solving_assistant(checkpointer, store)
         snapshot = await graph.aget_state(config)
     message_type_mapping = {"human": "user", "ai": "assistant"}
     details = []
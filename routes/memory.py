@@ -2,39 +2,58 @@ import asyncio
 
 from langchain_core.runnables import RunnableConfig
 from langchain.messages import HumanMessage
-from fastapi import APIRouter, Depends, Body, HTTPException
+from fastapi import APIRouter, Depends, Body, HTTPException, Query
 
+from core.config import settings
 from core.database import (
     langgraph_persistence_context,
-    create_memories,
-    batch_update_memories,
+    save_memories,
     get_memories_by_user,
+    count_memories_by_user,
     get_conversation_by_thread_id,
     delete_memory
 )
 from core.user import get_current_user
-from agents.solving_assistant.agent import create_solving_assistant
+from utils.pagination import decode_cursor, paginate
+from agents.solving_assistant.agent import get_solving_assistant
 from agents.solving_assistant.personalized_memory import summarize_personalized_memory
+from agents.solving_assistant.memory_index import memory_indexes
 
 
 router = APIRouter(prefix="/memory")
 
 
 @router.get("/list")
-async def get_memories(user: dict = Depends(get_current_user)):
-    memories = await get_memories_by_user(user["user_id"])
-    for memory in memories:
-        memory["created_at"] = memory["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-        memory["updated_at"] = memory["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
-    return {"memories": memories}
+async def get_memories(
+    user: dict = Depends(get_current_user),
+    limit: int = Query(settings.LIST_PAGE_SIZE, ge=1, le=settings.LIST_MAX_PAGE_SIZE),
+    cursor: str = Query(None)
+):
+    """按更新时间倒序分页，cursor 为上一页返回的 next_cursor；total 只在第一页返回"""
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    user_id = user["user_id"]
+    if before is None:
+        memories, total = await asyncio.gather(
+            get_memories_by_user(user_id, limit + 1),
+            count_memories_by_user(user_id)
+        )
+    else:
+        memories = await get_memories_by_user(user_id, limit + 1, before)
+        total = None
+    memories, next_cursor = paginate(memories, limit)
+    return {"memories": memories, "next_cursor": next_cursor, "total": total}
 
 
 @router.delete("")
 async def delete_memory_(
-    _: dict = Depends(get_current_user),
+    user: dict = Depends(get_current_user),
     memory_id: int = Body(embed=True)
 ):
     await delete_memory(memory_id)
+    await memory_indexes.on_deleted(user["user_id"], memory_id)
     return {"message": "OK"}
 
 
@@ -53,7 +72,7 @@ async def create_or_update_memories(
     # 获取历史对话
     config = RunnableConfig(configurable={"thread_id": thread_id})
     async with langgraph_persistence_context() as (checkpointer, store):
-        solving_assistant = create_solving_assistant(checkpointer, store)
+        solving_assistant = get_solving_assistant(checkpointer, store)
         state = await solving_assistant.aget_state(config)
         messages = state.values["messages"]
     # 构造对话字符串
@@ -80,10 +99,9 @@ async def create_or_update_memories(
             should_update_memoties.append(memory)
         else:
             should_create_memories.append(memory)
-    await asyncio.gather(
-        create_memories(should_create_memories, user_id),
-        batch_update_memories(should_update_memoties)
-    )
+    ids = await save_memories(should_create_memories, should_update_memoties, user_id)
+    created = [{**memory, "id": id_} for memory, id_ in zip(should_create_memories, ids)]
+    await memory_indexes.on_saved(user_id, created, should_update_memoties)
     return {
         "message": "OK", 
         "data": {
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends
+
+from core.database import conversation_cache, conversation_list_cache
+from core.model import ModelRegistry
+from core.llm_gateway import llm_gateway
+from core.jobs import background_jobs
+from agents.generic.json_parser import parse_json_stats
+from agents.question_manage.question_cache import question_data_cache
+from agents.solving_assistant.context import context_stats
+from agents.solving_assistant.answer_cache import answer_cache
+from agents.solving_assistant.memory_index import memory_indexes
+from core.user import get_admin_user, user_cache, user_profile_cache
+from utils.tool import mcp_session_pool, mcp_tool_catalog
+from workers.relay import stream_relay
+
+
+router = APIRouter(prefix="/metrics")
+
+
+@router.get("")
+async def get_metrics(_: dict = Depends(get_admin_user)):
+    return {
+        "user_cache": user_cache.stats(),
+        "user_profile_cache": user_profile_cache.stats(),
+        "conversation_cache": conversation_cache.stats(),
+        "conversation_list_cache": conversation_list_cache.stats(),
+        "mcp_session_pool": mcp_session_pool.stats(),
+        "mcp_tool_catalog": mcp_tool_catalog.stats(),
+        "question_data_cache": question_data_cache.stats(),
+        "model_registry": ModelRegistry.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "parse_json": parse_json_stats,
+        "solving_assistant_context": context_stats,
+        "answer_cache": answer_cache.stats(),
+        "memory_index": memory_indexes.stats(),
+        "background_jobs": background_jobs.stats(),
+        "stream_relay": stream_relay.stats()
+    }
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+from langchain.messages import ToolMessage
+from langgraph.store.memory import InMemoryStore
+
+from agents.question_manage.question_cache import (
+    QuestionDataCacheMiddleware,
+    question_data_cache,
+    mentions_new_question,
+    TOOL_RESULT_NAMESPACE
+)
+from agents.question_manage.state import QuestionMetadata
+
+
+def _call_tool(store: InMemoryStore, name: str, args: dict, content: str = "ok") -> ToolMessage:
+    request = SimpleNamespace(
+        tool_call={"name": name, "args": args, "id": "call-1"},
+        runtime=SimpleNamespace(store=store)
+    )
+
+    async def handler(_):
+        return ToolMessage(content=content, name=name, tool_call_id="call-1")
+
+    return asyncio.run(QuestionDataCacheMiddleware().awrap_tool_call(request, handler))
+
+
+def test_write_tool_invalidates_question_cache():
+    store = InMemoryStore()
+    metadata = QuestionMetadata(
+        question_id=1,
+        question_title="两数之和",
+        question_description="...",
+        question_difficulty="easy",
+        question_tags=["数组"]
+    )
+    asyncio.run(question_data_cache.put_metadata(store, metadata))
+    _call_tool(store, "query_question_info", {"question_id": 1}, "题目信息")
+    assert asyncio.run(question_data_cache.get(store, TOOL_RESULT_NAMESPACE, "query_question_info:1")) == "题目信息"
+
+    _call_tool(store, "update_solving_framework_for_question", {"question_id": 1})
+
+    assert asyncio.run(question_data_cache.get_metadata(store, 1)) is None
+    assert asyncio.run(question_data_cache.get(store, TOOL_RESULT_NAMESPACE, "query_question_info:1")) is None
+
+
+def test_read_tool_result_is_served_from_cache():
+    store = InMemoryStore()
+    _call_tool(store, "query_question_info", {"question_id": 2}, "第一次")
+    message = _call_tool(store, "query_question_info", {"question_id": 2}, "第二次")
+    assert message.content == "第一次"
+
+
+def test_new_question_intent_is_not_an_existing_question():
+    assert mentions_new_question("参考题目12创建一道新题目，并生成测试用例")
+    assert mentions_new_question("仿照题目 7 新建一道题目，然后生成解题框架")
+    assert not mentions_new_question("给题目12生成测试用例")
+    assert not mentions_new_question("修改题目3的内存限制")
@@ -0,0 +1,24 @@
+import base64
+from typing import Optional
+
+
+def encode_cursor(updated_at: str, id_: int) -> str:
+    """将一页最后一条记录的 (updated_at, id) 编码为翻页游标"""
+    return base64.urlsafe_b64encode(f"{updated_at}|{id_}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """解析翻页游标，游标无效时抛出 ValueError"""
+    try:
+        updated_at, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return updated_at, int(id_)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def paginate(rows: list[dict], limit: int) -> tuple[list[dict], Optional[str]]:
+    """rows 为多查询一条的结果，返回本页数据与下一页的游标（没有下一页时为 None）"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
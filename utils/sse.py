@@ -0,0 +1,76 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Iterator, Optional
+
+import orjson
+
+from core.config import settings
+from core.stream import StreamReader
+
+
+def dumps(data: Any) -> bytes:
+    if settings.SSE_JSON_ENCODER == "orjson":
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+def encode_frame(data: Any, event_id: Optional[int] = None) -> bytes:
+    """将事件编码为一个 SSE 数据帧，带上事件编号以便客户端断线重连"""
+    if event_id is None:
+        return b"data: " + dumps(data) + b"\n\n"
+    return b"id: %d\ndata: " % event_id + dumps(data) + b"\n\n"
+
+
+def _mergeable(data: Any) -> bool:
+    return isinstance(data, dict) and data.get("type") == "assistant" and isinstance(data.get("content"), str)
+
+
+def _merge(batch: list[tuple[int, Any]], max_chars: int) -> Iterator[tuple[int, Any]]:
+    # 合并后的事件使用其中最后一个片段的编号，重连时从它之后补发
+    pending: dict | None = None
+    pending_id = 0
+    for event_id, data in batch:
+        if (
+            pending is not None
+            and _mergeable(data)
+            and data["id"] == pending["id"]
+            and data.get("node") == pending.get("node")
+            and len(pending["content"]) < max_chars
+        ):
+            pending["content"] += data["content"]
+            pending_id = event_id
+            continue
+        if pending is not None:
+            yield pending_id, pending
+            pending = None
+        if _mergeable(data):
+            pending, pending_id = dict(data), event_id
+        else:
+            yield event_id, data
+    if pending is not None:
+        yield pending_id, pending
+
+
+async def coalesce(
+    reader: StreamReader,
+    max_delay: float = 0.02,
+    max_chars: int = 256
+) -> AsyncIterator[tuple[int, Any]]:
+    """从事件流中读取 (事件编号, 数据)，把同一条消息的连续文本片段合并后再输出。
+
+    读到文本片段后先等待 max_delay 秒，再一次性取出已有的事件，
+    合并同一条消息的连续片段（每段最多约 max_chars 个字符），其他事件保持原有顺序。
+    每个时间窗口只需要一次定时器，流结束时停止。
+    """
+    while True:
+        batch = [await reader.get()]
+        if max_delay > 0 and _mergeable(batch[0][1]):
+            await asyncio.sleep(max_delay)
+        while not reader.empty():
+            batch.append(reader.get_nowait())
+            if batch[-1][1] is None:
+                break
+        for event_id, data in _merge(batch, max_chars):
+            if data is None:
+                return
+            yield event_id, data
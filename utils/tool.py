@@ -1,16 +1,30 @@
 from langchain.tools import BaseTool
+from langchain_core.runnables import RunnableConfig
+from uvicorn.config import logger
 
 from core.config import settings
-from mcp_tool_adapter import load_mcp_tools
+from mcp_tool_adapter import Connection, MCPSessionPool, MCPToolCatalog
 
 
+# 按后端会话复用的 MCP 会话池
+mcp_session_pool = MCPSessionPool(
+    max_size=settings.MCP_SESSION_POOL_MAX_SIZE,
+    idle_timeout=settings.MCP_SESSION_IDLE_TIMEOUT,
+    health_check_interval=settings.MCP_SESSION_HEALTH_CHECK_INTERVAL
+)
+# 进程级的 MCP 工具目录
+mcp_tool_catalog = MCPToolCatalog(mcp_session_pool, ttl=settings.MCP_TOOL_CATALOG_TTL)
+
 mcp_connection_config = {
     "url": settings.MCP_SERVER_URL, 
-    "transport": "streamable_http"
+    "transport": "streamable_http",
+    "session_kwargs": {
+        "message_handler": mcp_tool_catalog.message_handler
+    }
 }
 
 
-async def load_tools(backend_session_id: str, effective_tools: set[str]) -> list[BaseTool]:
+def build_connection(backend_session_id: str) -> Connection:
     connection_config = mcp_connection_config.copy()
     connection_config.update(
         {
@@ -19,16 +33,28 @@ async def load_tools(backend_session_id: str, effective_tools: set[str]) -> list
             }
         }
     )
-    all_mcp_tools = await load_mcp_tools(connection_config)
-    if not all_mcp_tools:
-        return []
-    tools: list[BaseTool] = []
-    for mcp_tool in all_mcp_tools:
-        if mcp_tool.name in effective_tools:
-            tools.append(mcp_tool)
-    return tools
-
-
-async def load_tools_from_config(config: dict, effective_tools: set[str]) -> list[BaseTool]:
-    backend_session_id = config["metadata"].get("backend-session-id")
-    return await load_tools(backend_session_id, effective_tools)
+    return connection_config
+
+
+def resolve_connection(config: RunnableConfig) -> Connection:
+    """从工具调用的 RunnableConfig 中解析出当前后端会话的连接配置"""
+    backend_session_id = (
+        config.get("configurable", {}).get("backend-session-id")
+        or config.get("metadata", {}).get("backend-session-id")
+    )
+    return build_connection(backend_session_id)
+
+
+async def load_shared_tools(config: RunnableConfig | None, effective_tools: set[str]) -> list[BaseTool]:
+    """加载可被缓存的智能体复用的工具，工具在调用时才绑定当前后端会话"""
+    if config is not None:
+        await mcp_tool_catalog.ensure_fresh(resolve_connection(config))
+    return mcp_tool_catalog.get_shared_tools(effective_tools, resolve_connection)
+
+
+async def preload_tool_catalog():
+    """启动时预先拉取工具目录，失败时推迟到第一次使用时再拉取"""
+    try:
+        await mcp_tool_catalog.refresh(mcp_connection_config)
+    except Exception as e:
+        logger.warning("预加载 MCP 工具目录失败：%r", e)
@@ -32,3 +32,12 @@ def user_profile_to_string(user_profile: UserProfile) -> str:
         f"弱势标签：{weak_tags}",
     ]
     return "\n".join(result)
+
+
+def user_profile_fingerprint(user_profile: UserProfile) -> str:
+    """用户画像中影响回答方式的部分：擅长难度与擅长、弱势标签，不包含逐题变化的统计数字"""
+    if not user_profile:
+        return ""
+    strong_tags = ",".join(sorted(tag["tag_name"] for tag in user_profile["strong_tags"]))
+    weak_tags = ",".join(sorted(tag["tag_name"] for tag in user_profile["weak_tags"]))
+    return f"{user_profile['strong_difficulty']}|{strong_tags}|{weak_tags}"
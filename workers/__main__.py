@@ -0,0 +1,47 @@
+"""
+智能体 worker 进程入口，配合 STREAM_RELAY=redis 使用：
+
+    uv run python -m workers --processes 4
+
+接口进程（可以启动多个 uvicorn worker）只负责提交任务与转发事件流，
+智能体在这里的进程池中运行。
+"""
+import argparse
+import multiprocessing
+import signal
+
+from core.config import settings
+from workers.worker import run_process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SmartOJ AI agent workers")
+    parser.add_argument("--processes", type=int, default=settings.WORKER_PROCESSES)
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    if args.processes <= 1:
+        run_process(args.concurrency)
+        return
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_process, args=(args.concurrency,), name=f"agent-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    # 子进程各自处理 SIGINT/SIGTERM，主进程转发终止信号后等待它们退出
+    def terminate(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import asyncio
+import json
+import traceback
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # 只有使用 redis 中继时才需要安装
+    redis = None
+from uvicorn.config import logger
+
+from core.admission import AdmissionController, RedisAdmissionController, Ticket, admission_controller
+from core.config import settings
+from core.stream import StreamChannel, StreamSessionRegistry, stream_sessions
+from utils.sse import dumps
+from workers.runners import RUNNERS
+
+
+def log_task_result(key: str):
+    def task_done_callback(task: asyncio.Task) -> None:
+        try:
+            task.result()
+        except asyncio.CancelledError:
+            logger.info("任务<%s>被取消", key)
+        except Exception as _:
+            logger.info("任务<%s>异常", key)
+            traceback.print_exc()
+        else:
+            logger.info("任务<%s>完成", key)
+    return task_done_callback
+
+
+class StreamRelay:
+    """智能体运行任务与事件流的中继。
+
+    接口进程通过 submit 提交运行任务，通过 attach 读取事件流、interrupt 中止任务；
+    任务在哪里执行、事件如何传回由具体实现决定。
+    attach 得到的读取者接口与 StreamReader 相同，可以直接交给 coalesce 使用。
+    """
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def submit(self, key: str, runner: str, payload: dict, user: dict):
+        """提交运行任务，超出准入限制且无法排队时抛出 AdmissionRejected"""
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def attach(self, key: str, last_event_id: Optional[int] = None):
+        """返回异步上下文管理器，事件流不存在时得到 None"""
+        raise NotImplementedError
+
+    async def interrupt(self, key: str):
+        raise NotImplementedError
+
+    def stats(self) -> dict[str, Any]:
+        return {}
+
+
+class MemoryRelay(StreamRelay):
+    """在接口进程内运行智能体，事件保存在进程内的 StreamSessionRegistry 中，只支持单个 worker。
+
+    运行前先经过准入控制，排队期间向事件流推送排队位置。
+    """
+
+    def __init__(self, sessions: StreamSessionRegistry, admission: AdmissionController, queue_timeout: float = 60.0):
+        self.sessions = sessions
+        self.admission = admission
+        self.queue_timeout = queue_timeout
+
+    async def start(self):
+        await self.sessions.start()
+
+    async def close(self):
+        await self.sessions.close()
+
+    async def submit(self, key: str, runner: str, payload: dict, user: dict):
+        ticket = self.admission.reserve(user["user_id"], self.admission.role_of(user))
+        session = self.sessions.create(key)
+        task = asyncio.create_task(self._run(session.channel, ticket, runner, payload))
+        task.add_done_callback(log_task_result(key))
+        session.bind(task)
+
+    async def _run(self, channel: StreamChannel, ticket: Ticket, runner: str, payload: dict):
+        async def on_position(position: int):
+            await channel.put({"type": "queue", "position": position})
+
+        try:
+            try:
+                await self.admission.wait(ticket, on_position, self.queue_timeout)
+            except asyncio.TimeoutError:
+                await channel.put({"type": "error", "message": "The service is busy, please try again later"})
+                await channel.put(None)
+                return
+            await RUNNERS[runner](channel.put, **payload)
+        finally:
+            self.admission.release(ticket)
+
+    async def exists(self, key: str) -> bool:
+        return self.sessions.get(key) is not None
+
+    @asynccontextmanager
+    async def attach(self, key: str, last_event_id: Optional[int] = None):
+        session = self.sessions.get(key)
+        if session is None:
+            yield None
+            return
+        reader = session.attach(last_event_id)
+        try:
+            yield reader
+        finally:
+            session.detach()
+
+    async def interrupt(self, key: str):
+        session = self.sessions.get(key)
+        if session is not None:
+            session.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        return {**self.sessions.stats(), "admission": self.admission.stats()}
+
+
+class RedisStreamPublisher:
+    """把一次运行的事件写入 Redis Stream。
+
+    事件编号写为 Stream 条目 ID 的序号部分（0-<编号>），断线重连时可以直接按编号续读；
+    短时间内的多个事件合并为一次 pipeline 写入。
+    """
+
+    def __init__(self, client: "redis.Redis", stream_key: str, run_key: str, maxlen: int, ttl: float, flush_delay: float):
+        self.client = client
+        self.stream_key = stream_key
+        self.run_key = run_key
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self._last_id = 0
+        self._ended = False
+        self._pending: list[dict] = []
+        self._flushing: asyncio.Task | None = None
+        # 保证各批事件按编号顺序写入
+        self._lock = asyncio.Lock()
+
+    async def put(self, data: Any):
+        if self._ended:
+            return
+        if data is None:
+            self._ended = True
+            self._pending.append({"end": 1})
+            await self._flush_now()
+            return
+        self._last_id += 1
+        self._pending.append({"id": self._last_id, "data": data})
+        if self._flushing is None:
+            self._flushing = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_delay)
+        self._flushing = None
+        await self._write()
+
+    async def _flush_now(self):
+        if self._flushing is not None:
+            self._flushing.cancel()
+            self._flushing = None
+        await self._write()
+
+    async def _write(self):
+        async with self._lock:
+            events, self._pending = self._pending, []
+            if not events:
+                return
+            pipeline = self.client.pipeline(transaction=False)
+            for event in events:
+                if "end" in event:
+                    pipeline.xadd(self.stream_key, {"end": 1}, id=f"0-{self._last_id + 1}")
+                else:
+                    pipeline.xadd(
+                        self.stream_key, {"data": dumps(event["data"])}, id=f"0-{event['id']}",
+                        maxlen=self.maxlen, approximate=True
+                    )
+            pipeline.expire(self.stream_key, int(self.ttl))
+            # 运行期间持续续期运行记录，读取者据此判断运行是否仍然存在
+            pipeline.expire(self.run_key, int(self.ttl))
+            await pipeline.execute()
+
+
+class RedisStreamReader:
+    """从 Redis Stream 读取事件，接口与 StreamReader 相同。
+
+    Stream 在 worker 写入第一个事件时才会创建，任务排队或等待首个 token 期间并不存在，
+    因此只有读到结束标记，或者运行记录已过期、已被新的运行替换时才结束。
+    """
+
+    def __init__(
+        self,
+        client: "redis.Redis",
+        stream_key: str,
+        run_key: str,
+        run_id: str,
+        cursor: int = 0,
+        block: float = 5.0
+    ):
+        self.client = client
+        self.stream_key = stream_key
+        self.run_key = run_key
+        self.run_id = run_id
+        self.block = block
+        self._cursor = cursor
+        self._fetched = cursor
+        self._buffer: deque[tuple[int, Any]] = deque()
+        self._ended = False
+
+    def empty(self) -> bool:
+        return not self._buffer and not self._ended
+
+    def get_nowait(self) -> tuple[int, Any]:
+        if self._buffer:
+            event = self._buffer.popleft()
+            self._cursor = event[0]
+            return event
+        if self._ended:
+            return self._cursor, None
+        raise asyncio.QueueEmpty
+
+    async def get(self) -> tuple[int, Any]:
+        while self.empty():
+            await self._fetch()
+        return self.get_nowait()
+
+    async def _fetch(self):
+        response = await self.client.xread(
+            {self.stream_key: f"0-{self._fetched}"}, count=500, block=int(self.block * 1000)
+        )
+        if not response:
+            # 等待超时，运行记录不存在或已被替换说明这次运行不会再写入事件
+            run_id = await self.client.get(self.run_key)
+            if run_id is None or run_id.decode() != self.run_id:
+                self._ended = True
+            return
+        for entry_id, fields in response[0][1]:
+            self._fetched = int(entry_id.split(b"-")[1])
+            if b"end" in fields:
+                self._ended = True
+                return
+            self._buffer.append((self._fetched, json.loads(fields[b"data"])))
+
+
+class RedisRelay(StreamRelay):
+    """通过 Redis 在接口进程与 worker 进程之间中继。
+
+    接口进程把运行任务放入 Redis 列表，由 `python -m workers` 启动的 worker 进程取出执行；
+    事件写入每次运行独立的 Redis Stream，任意接口进程都可以读取；
+    中止请求携带运行ID通过发布订阅频道广播给所有 worker，由执行该运行的 worker 取消任务。
+    同时运行的任务数由 worker 的进程数与并发数限制，在途的任务数由 RedisAdmissionController 限制。
+    后端会话ID不写入任务，而是单独保存在以运行ID为键的短期记录中，worker 取出任务时读取并删除。
+    """
+
+    def __init__(self, url: str, prefix: str = "smartoj-ai", ttl: float = 600.0, maxlen: int = 2000):
+        if redis is None:
+            raise RuntimeError("STREAM_RELAY=redis requires the redis package, install it with `uv add redis`")
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.maxlen = maxlen
+        self.jobs_key = f"{prefix}:jobs"
+        self.interrupt_channel = f"{prefix}:interrupt"
+        self.admission = RedisAdmissionController(
+            self.client,
+            prefix,
+            global_limit=settings.ADMISSION_GLOBAL_LIMIT,
+            role_limits=settings.ADMISSION_ROLE_LIMITS,
+            user_limits=settings.ADMISSION_USER_LIMITS,
+            queue_size=settings.ADMISSION_QUEUE_SIZE,
+            ttl=ttl
+        )
+        self.submitted = 0
+        self.skipped = 0
+
+    def run_key(self, key: str) -> str:
+        return f"{self.prefix}:run:{key}"
+
+    def stream_key(self, key: str, run_id: str) -> str:
+        return f"{self.prefix}:stream:{key}:{run_id}"
+
+    def session_key(self, run_id: str) -> str:
+        return f"{self.prefix}:session:{run_id}"
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def submit(self, key: str, runner: str, payload: dict, user: dict):
+        run_id = uuid.uuid4().hex
+        user_id, role = user["user_id"], AdmissionController.role_of(user)
+        await self.admission.reserve(run_id, user_id, role)
+        try:
+            previous = await self.client.set(self.run_key(key), run_id, ex=int(self.ttl), get=True)
+            # 同一个对话重新提问，先中止仍在进行的上一次运行
+            if previous is not None:
+                await self.client.publish(self.interrupt_channel, previous)
+            payload = dict(payload)
+            session_id = payload.pop("session_id", None)
+            job = {"key": key, "run_id": run_id, "runner": runner, "payload": payload, "user_id": user_id, "role": role}
+            pipeline = self.client.pipeline(transaction=False)
+            if session_id is not None:
+                pipeline.set(self.session_key(run_id), session_id, ex=int(self.ttl))
+            pipeline.lpush(self.jobs_key, json.dumps(job))
+            await pipeline.execute()
+        except BaseException:
+            await self.admission.release(run_id, user_id, role)
+            raise
+        self.submitted += 1
+
+    async def next_job(self, timeout: float = 5.0) -> Optional[dict]:
+        item = await self.client.brpop(self.jobs_key, timeout=timeout)
+        return json.loads(item[1]) if item else None
+
+    async def claim(self, job: dict) -> Optional[dict]:
+        """取回任务的完整参数；排队期间已被新的运行替换或已过期的任务返回 None"""
+        run_id = await self.client.get(self.run_key(job["key"]))
+        session_id = await self.client.getdel(self.session_key(job["run_id"]))
+        if run_id is None or run_id.decode() != job["run_id"]:
+            self.skipped += 1
+            return None
+        payload = job["payload"]
+        if session_id is not None:
+            payload = {**payload, "session_id": session_id.decode()}
+        return payload
+
+    async def finish(self, job: dict):
+        """运行结束（包括被跳过）后归还准入名额"""
+        await self.admission.release(job["run_id"], job["user_id"], job["role"])
+
+    def publisher(self, key: str, run_id: str) -> RedisStreamPublisher:
+        return RedisStreamPublisher(
+            self.client, self.stream_key(key, run_id), self.run_key(key), self.maxlen, self.ttl, settings.SSE_COALESCE_DELAY
+        )
+
+    async def interrupts(self) -> AsyncIterator[str]:
+        async with self.client.pubsub() as pubsub:
+            await pubsub.subscribe(self.interrupt_channel)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"].decode()
+
+    async def exists(self, key: str) -> bool:
+        return bool(await self.client.exists(self.run_key(key)))
+
+    @asynccontextmanager
+    async def attach(self, key: str, last_event_id: Optional[int] = None):
+        run_id = await self.client.get(self.run_key(key))
+        if run_id is None:
+            yield None
+            return
+        run_id = run_id.decode()
+        yield RedisStreamReader(
+            self.client, self.stream_key(key, run_id), self.run_key(key), run_id, last_event_id or 0
+        )
+
+    async def interrupt(self, key: str):
+        run_id = await self.client.get(self.run_key(key))
+        if run_id is not None:
+            await self.client.publish(self.interrupt_channel, run_id)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "relay": "redis",
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+            "admission": self.admission.stats()
+        }
+
+
+def create_relay() -> StreamRelay:
+    if settings.STREAM_RELAY == "redis":
+        return RedisRelay(settings.REDIS_URL, settings.RELAY_KEY_PREFIX, settings.RELAY_STREAM_TTL, settings.STREAM_BUFFER_SIZE)
+    return MemoryRelay(stream_sessions, admission_controller, settings.ADMISSION_QUEUE_TIMEOUT)
+
+
+stream_relay = create_relay()
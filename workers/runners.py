@@ -0,0 +1,210 @@
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable
+
+from langchain_core.runnables import RunnableConfig
+from langchain.messages import HumanMessage, AIMessage
+from langgraph.graph.state import CompiledStateGraph
+
+from core.database import (
+    get_conversation_by_thread_id,
+    create_conversation,
+    update_conversation_title,
+    langgraph_persistence_context
+)
+from core.jobs import background_jobs
+from core.user import get_cached_user_profile
+from utils.user_profile import user_profile_to_string, user_profile_fingerprint
+from agents.generic import generate_title
+from agents.question_manage.agent import get_question_manage_graph
+from agents.solving_assistant.agent import get_solving_assistant, summarize, SolvingAssistantMessagesState
+from agents.solving_assistant.answer_cache import answer_cache
+from agents.solving_assistant.memory_index import memory_indexes
+
+
+# 向事件流写入一个事件，写入 None 表示结束
+Emit = Callable[[Any], Awaitable[None]]
+
+# 推送缓存回答时每个分片的字符数
+CACHED_ANSWER_CHUNK_SIZE = 16
+
+
+async def create_conversation_if_absent(title: str, user_id: str, question_id: int | None, thread_id: str):
+    # 后台任务可能重试，已创建过的对话不再重复创建
+    if await get_conversation_by_thread_id(thread_id):
+        return
+    await create_conversation(title, user_id, question_id, thread_id)
+
+
+async def finalize_question_manage_conversation(thread_id: str, user_id: str, query: str):
+    conversation = await get_conversation_by_thread_id(thread_id)
+    if conversation:
+        await update_conversation_title(conversation["id"], conversation["title"])  # 更新对话活跃时间
+        return
+    # 新对话，根据对话内容生成标题
+    async with langgraph_persistence_context() as (checkpointer, store):
+        graph = get_question_manage_graph(checkpointer, store)
+        snapshot = await graph.aget_state(RunnableConfig(configurable={"thread_id": thread_id}))
+    assistant_messages = []
+    for message in snapshot.values["messages"]:
+        if isinstance(message, AIMessage):
+            assistant_messages.append(message.text)
+    answer = "".join(assistant_messages)
+    title = await generate_title(query, answer)
+    # 标题字段最长 50 个字符
+    await create_conversation_if_absent(title[:50], user_id, None, thread_id)
+
+
+async def summarize_solving_assistant_conversation(thread_id: str):
+    config = RunnableConfig(configurable={"thread_id": thread_id})
+    async with langgraph_persistence_context() as (checkpointer, store):
+        agent = get_solving_assistant(checkpointer, store)
+        snapshot = await agent.aget_state(config)
+    # 生成摘要期间不占用数据库连接
+    update = await summarize(snapshot.values)
+    if not update:
+        return
+    # 消息只会追加，已摘要的前缀不会变化，期间写入的新一轮对话不受影响
+    async with langgraph_persistence_context() as (checkpointer, store):
+        agent = get_solving_assistant(checkpointer, store)
+        await agent.aupdate_state(config, update, as_node="node")
+
+
+async def run_question_manage(emit: Emit, thread_id: str, user_id: str, session_id: str, query: str):
+    config = RunnableConfig(configurable={"thread_id": thread_id, "backend-session-id": session_id})
+    agent_input = {"messages": [HumanMessage(query)]}
+    async with langgraph_persistence_context() as (checkpointer, store):
+        graph = get_question_manage_graph(checkpointer, store)
+        try:
+            async for namespace, stream_mode, data in graph.astream(
+                agent_input, config, stream_mode=["messages", "custom"], subgraphs=True
+            ):
+                if stream_mode == "custom":
+                    await emit(data)
+                    continue
+                if not namespace:
+                    continue
+                message_chunk, _ = data
+                message_id = message_chunk.id
+                if message_id[:6] != "lc_run":
+                    continue
+                content = message_chunk.content
+                if not content:
+                    continue
+                name = namespace[-1].split(":")[0]
+                await emit({
+                    "content": content,
+                    "id": message_id,
+                    "node": name,
+                    "type": "assistant"
+                })
+        finally:
+            await emit(None)
+    # 流已结束，保存对话等收尾工作交给后台任务
+    await background_jobs.submit(
+        "finalize_question_manage_conversation",
+        finalize_question_manage_conversation,
+        thread_id, user_id, query
+    )
+
+
+async def run_solving_assistant(
+    emit: Emit,
+    thread_id: str,
+    user: dict,
+    session_id: str,
+    query: str,
+    question_description: str,
+    code: str,
+    question_id: int,
+    use_cache: bool
+):
+    config = RunnableConfig(configurable={"thread_id": thread_id})
+    user_id = user["user_id"]
+
+    async def prepare_agent_input() -> tuple[SolvingAssistantMessagesState, str]:
+        """返回智能体的输入，以及回答缓存使用的个性化指纹"""
+        # 用户画像与用户记忆并发获取，只选取与当前题目和提问相关的记忆
+        user_profile, memories = await asyncio.gather(
+            get_cached_user_profile(user_id, session_id),
+            memory_indexes.select(user_id, f"{question_description}\n{query}")
+        )
+        user_memory = ",".join(memories)
+        agent_input = {
+            "messages": [HumanMessage(query)],
+            "code": code,
+            "user_profile": user_profile_to_string(user_profile),
+            "user_memory": user_memory,
+            "username": user["name"],
+            "question_description": question_description
+        }
+        return agent_input, f"{user_profile_fingerprint(user_profile)}\x00{user_memory}"
+
+    async def stream_cached_answer(agent: CompiledStateGraph, agent_input: SolvingAssistantMessagesState, answer: str):
+        # 与模型输出一样分片推送，客户端无需区分
+        message_id = f"cache-{uuid.uuid4()}"
+        for i in range(0, len(answer), CACHED_ANSWER_CHUNK_SIZE):
+            await emit({
+                "content": answer[i:i + CACHED_ANSWER_CHUNK_SIZE],
+                "id": message_id,
+                "node": "solving_assistant",
+                "type": "assistant"
+            })
+        # 写入检查点，保证对话记录与正常回答一致
+        messages = [HumanMessage(query), AIMessage(answer, id=message_id)]
+        await agent.aupdate_state(config, {**agent_input, "messages": messages}, as_node="node")
+
+    async with langgraph_persistence_context() as (checkpointer, store):
+        agent = get_solving_assistant(checkpointer, store)
+        try:
+            (agent_input, personalization), conversation = await asyncio.gather(
+                prepare_agent_input(), get_conversation_by_thread_id(thread_id)
+            )
+            # 只缓存新对话的第一轮，用户画像与记忆通过个性化指纹区分
+            cacheable = use_cache and not conversation
+            answer = await answer_cache.get(question_id, query, code, personalization) if cacheable else None
+            if answer is not None:
+                await stream_cached_answer(agent, agent_input, answer)
+            else:
+                contents = []
+                async for message_chunk, _ in agent.astream(agent_input, config, stream_mode="messages"):
+                    content = message_chunk.content
+                    if not content:
+                        continue
+                    if isinstance(content, str):
+                        contents.append(content)
+                    await emit({
+                        "content": content,
+                        "id": message_chunk.id,
+                        "node": "solving_assistant",
+                        "type": "assistant"
+                    })
+        finally:
+            await emit(None)
+    # 流已结束，缓存回答与保存对话交给后台任务
+    if cacheable and answer is None:
+        await background_jobs.submit(
+            "cache_solving_assistant_answer",
+            answer_cache.put,
+            question_id, query, code, personalization, "".join(contents), user["name"]
+        )
+    if not conversation:
+        await background_jobs.submit(
+            "create_solving_assistant_conversation",
+            create_conversation_if_absent,
+            "", user_id, question_id, thread_id
+        )
+    else:
+        # 新对话只有一轮，不需要摘要
+        await background_jobs.submit(
+            "summarize_solving_assistant_conversation",
+            summarize_solving_assistant_conversation,
+            thread_id
+        )
+
+
+# 智能体运行函数，任务中只保存名称与参数，参数需要能被 JSON 序列化
+RUNNERS: dict[str, Callable[..., Awaitable[None]]] = {
+    "question_manage": run_question_manage,
+    "solving_assistant": run_solving_assistant
+}
@@ -0,0 +1,37 @@
+from contextlib import asynccontextmanager
+
+from core.database import ConnectionManager, langgraph_persistence_context
+from core.http import HttpClientManager
+from core.jobs import background_jobs
+from core.model import ModelRegistry
+from core.config import settings
+from utils.tool import mcp_session_pool, preload_tool_catalog
+from agents.question_manage.agent import get_question_manage_graph
+from agents.question_manage.sub_agent import warm_up_sub_agents
+from agents.solving_assistant.agent import get_solving_assistant
+from agents.solving_assistant.memory_index import memory_indexes
+
+
+@asynccontextmanager
+async def agent_runtime():
+    """运行智能体所需的连接池、后台任务与预热，接口进程与 worker 进程共用"""
+    await ConnectionManager.initialize(settings.DATABASE_URI)
+    await HttpClientManager.initialize()
+    await background_jobs.start()
+    await mcp_session_pool.start()
+    await preload_tool_catalog()
+    # 预先编译智能体图
+    get_question_manage_graph()
+    get_solving_assistant()
+    await warm_up_sub_agents()
+    async with langgraph_persistence_context() as (checkpointer, store):
+        await checkpointer.setup()
+        await store.setup()
+        yield
+    # 先等待后台任务收尾，它们依赖数据库与模型连接
+    await background_jobs.close()
+    await mcp_session_pool.close()
+    await memory_indexes.close()
+    await HttpClientManager.close()
+    await ModelRegistry.close()
+    await ConnectionManager.close()
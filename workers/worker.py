@@ -0,0 +1,110 @@
+import asyncio
+import signal
+import traceback
+from contextlib import suppress
+
+from uvicorn.config import logger
+
+from workers.relay import RedisRelay, stream_relay
+from workers.runners import RUNNERS
+from workers.runtime import agent_runtime
+
+
+class AgentWorker:
+    """从中继取出运行任务并执行，最多同时执行 concurrency 个任务"""
+
+    def __init__(self, relay: RedisRelay, concurrency: int = 16):
+        self.relay = relay
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        # 运行ID -> 任务
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    async def run(self):
+        listener = asyncio.create_task(self._listen_interrupts())
+        try:
+            while True:
+                await self._slots.acquire()
+                try:
+                    job = await self.relay.next_job()
+                except BaseException:
+                    self._slots.release()
+                    raise
+                if job is None:
+                    self._slots.release()
+                    continue
+                task = asyncio.create_task(self._execute(job))
+                self._tasks[job["run_id"]] = task
+        finally:
+            listener.cancel()
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(listener, *self._tasks.values(), return_exceptions=True)
+
+    async def _execute(self, job: dict):
+        key, run_id = job["key"], job["run_id"]
+        publisher = self.relay.publisher(key, run_id)
+        try:
+            payload = await self.relay.claim(job)
+            if payload is None:
+                logger.info("任务<%s>已被新的运行替换，跳过", key)
+                return
+            await RUNNERS[job["runner"]](publisher.put, **payload)
+            self.completed += 1
+            logger.info("任务<%s>完成", key)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            logger.info("任务<%s>被取消", key)
+            # 运行函数在结束标记写入前被取消时补写，读取者不会一直等待
+            with suppress(Exception):
+                await publisher.put(None)
+        except Exception as _:
+            self.failed += 1
+            logger.info("任务<%s>异常", key)
+            traceback.print_exc()
+        finally:
+            self._tasks.pop(run_id, None)
+            self._slots.release()
+            with suppress(Exception):
+                await self.relay.finish(job)
+
+    async def _listen_interrupts(self):
+        while True:
+            try:
+                async for run_id in self.relay.interrupts():
+                    task = self._tasks.get(run_id)
+                    if task is not None:
+                        task.cancel()
+            except Exception as e:
+                logger.warning(f"Interrupt subscription failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "running": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled
+        }
+
+
+async def serve(concurrency: int):
+    if not isinstance(stream_relay, RedisRelay):
+        raise RuntimeError("Agent workers require STREAM_RELAY=redis")
+    async with agent_runtime():
+        worker = AgentWorker(stream_relay, concurrency)
+        run = asyncio.create_task(worker.run())
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, run.cancel)
+        with suppress(asyncio.CancelledError):
+            await run
+        await stream_relay.close()
+        logger.info("Agent worker stopped: %s", worker.stats())
+
+
+def run_process(concurrency: int):
+    asyncio.run(serve(concurrency))